@@ -3,6 +3,11 @@ from parsers import *
 from annotations import *
 from ontology import *
 from hierarchy import *
+from minhash import MinHashIndex
+from simmatrix import BlockedSimilarityMatrix
+from annotation_store import AnnotationStore
+from filters import EXPERIMENTAL_CODES
+import heapq
 import numpy as np
 import pandas as pd
 from abc import ABC, abstractmethod
@@ -12,48 +17,111 @@ import matplotlib.pyplot as plt
 
 
 
+class _Descending(str):
+    # reversed string order: in a (score, gene) min-heap ties evict the alphabetically last gene
+    def __lt__(self, other):
+        return str.__gt__(self, other)
+
+    def __gt__(self, other):
+        return str.__lt__(self, other)
+
+
 class GeneAnalyser:
     def __init__(self,annotation_collection: AnnotationCollection,
                  term_collection: TermCollection,
-                 hierarchy: OntologyHierarchy):
+                 hierarchy: OntologyHierarchy,
+                 mask=None):
 
         self.__annotations = annotation_collection
+        self.__mask = mask   # optional boolean row mask (filters.AnnotationMasks), None = every row
         self.__ontology = term_collection
         self.__hierarchy = hierarchy
+        self.__gene_bits: dict[str, int] | None = None
+        self.__term_genes: dict[int, set[str]] | None = None
+        self.__gene_anc: dict[str, int] = {}
+        self.__gene_desc: dict[str, int] = {}
 
 
     def _get_ann(self, gene: str) -> list[GeneAnnotation]:
-        return self.__annotations.get_by_gene_name(gene)
-    
+        return self.__annotations.get_by_gene_name(gene, self.__mask)
+
+    def _build_gene_index(self) -> None:
+        # one pass over the annotations: gene -> term bitset and term -> genes postings
+        self.__gene_bits = {}
+        self.__term_genes = {}
+        for i, ann in enumerate(self.__annotations):
+            if ann.term is None or (self.__mask is not None and not self.__mask[i]):
+                continue
+            idx = self.__hierarchy.term_index(ann.term.go_id)
+            if idx is None:
+                continue
+            self.__gene_bits[ann.gene_name] = self.__gene_bits.get(ann.gene_name, 0) | (1 << idx)
+            self.__term_genes.setdefault(idx, set()).add(ann.gene_name)
+
+    def build_index(self) -> None:
+        # built on first use; called up front where the index should be shared (forked workers)
+        if self.__gene_bits is None:
+            self._build_gene_index()
+
+    def refresh_genes(self, genes, mask=None) -> None:
+        # after an annotation delta: rebuild the bitsets/postings of the touched genes only
+        self.__mask = mask
+        if self.__gene_bits is None:
+            return
+
+        for gene in genes:
+            old = self.__gene_bits.pop(gene, 0)
+            while old:   # by position, the term may be gone after an ontology release
+                low = old & -old
+                self.__term_genes[low.bit_length() - 1].discard(gene)
+                old ^= low
+            self.__gene_anc.pop(gene, None)
+            self.__gene_desc.pop(gene, None)
+
+            for ann in self._get_ann(gene):
+                idx = self.__hierarchy.term_index(ann.go_id) if ann.term is not None else None
+                if idx is None:
+                    continue
+                self.__gene_bits[gene] = self.__gene_bits.get(gene, 0) | (1 << idx)
+                self.__term_genes.setdefault(idx, set()).add(gene)
+
+    def gene_term_bits(self, gene: str) -> int:
+        self.build_index()
+        return self.__gene_bits.get(gene, 0)
+
+    def gene_ancestor_bits(self, gene: str) -> int:
+        # OR of the ancestor closures of every term annotated to the gene
+        bits = self.__gene_anc.get(gene)
+        if bits is None:
+            bits = 0
+            for go_id in self.__hierarchy.bits_to_terms(self.gene_term_bits(gene)):
+                bits |= self.__hierarchy.ancestor_bits(go_id)
+            self.__gene_anc[gene] = bits
+        return bits
+
+    def gene_descendant_bits(self, gene: str) -> int:
+        bits = self.__gene_desc.get(gene)
+        if bits is None:
+            bits = 0
+            for go_id in self.__hierarchy.bits_to_terms(self.gene_term_bits(gene)):
+                bits |= self.__hierarchy.descendant_bits(go_id)
+            self.__gene_desc[gene] = bits
+        return bits
+
     def is_gene_ancestor(self, gene1: str, gene2: str) -> bool:
-        anns1 = self._get_ann(gene1)
-        anns2 = self._get_ann(gene2)
-        for a1 in anns1:
-            for a2 in anns2:
-                if a1.term is not None and a2.term is not None:
-                    if self.__hierarchy.is_ancestor(a1.term.go_id,a2.term.go_id):
-                        return True
-        return False
+        # some term of gene1 is an ancestor of some term of gene2
+        return bool(self.gene_term_bits(gene1) & self.gene_ancestor_bits(gene2))
 
     def is_gene_descendant(self, gene1: str, gene2: str) -> bool:
-        anns1 = self._get_ann(gene1)
-        anns2 = self._get_ann(gene2)
-        
-        for a1 in anns1:
-            for a2 in anns2:
-                if a1.term is not None and a2.term is not None:
-                    if self.__hierarchy.is_descendant(a1.term.go_id, a2.term.go_id):
-                        return True
-        return False
-    
+        return bool(self.gene_term_bits(gene1) & self.gene_descendant_bits(gene2))
+
     def gene_specificity(self, gene: str) -> float | None:
         anns = self._get_ann(gene)
         depths = []
         
         for ann in anns:
             if ann.term is not None:
-                ancestors = self.__hierarchy.__ontology.get_ancestors(ann.term.go_id)
-                depths.append(len(ancestors))
+                depths.append(self.__hierarchy.ancestor_bits(ann.term.go_id).bit_count())
         
         if not depths:
             return None
@@ -62,27 +130,30 @@ class GeneAnalyser:
 
 
     def genes_functionally_related (self, gene1: str, gene2: str) -> bool:
-        anns1 = self._get_ann(gene1)
-        anns2 = self._get_ann(gene2)
-
-        terms1 = [ann.term.go_id for ann in anns1 if ann.term is not None]
-        terms2 = [ann.term.go_id for ann in anns2 if ann.term is not None]
-
-
-        for t1 in terms1:
-            for t2 in terms2:
-                if self.__hierarchy.is_related(t1, t2):
-                    return True
-        return False
+        return self.is_gene_ancestor(gene1, gene2) or self.is_gene_descendant(gene1, gene2)
+
+    def related_genes(self, gene: str) -> set[str]:
+        # every gene with a term in the ancestor or descendant closure of this gene's terms
+        self.build_index()
+        related_bits = self.gene_ancestor_bits(gene) | self.gene_descendant_bits(gene)
+
+        out = set()
+        while related_bits:
+            low = related_bits & -related_bits
+            out |= self.__term_genes.get(low.bit_length() - 1, set())
+            related_bits ^= low
+        out.discard(gene)
+        return out
 
 
-    def gene_paths(self, gene1: str, gene2: str):
-        terms1 = {a.term.go_id for a in self._get_ann(gene1) if a.term}
-        terms2 = {a.term.go_id for a in self._get_ann(gene2) if a.term}
+    def gene_paths(self, gene1: str, gene2: str, progress=None):
+        # sorted, so ties between equally long paths don't depend on the hash seed
+        terms1 = sorted({a.term.go_id for a in self._get_ann(gene1) if a.term})
+        terms2 = sorted({a.term.go_id for a in self._get_ann(gene2) if a.term})
 
         seen = set()
         out = []
-        for t1 in terms1:
+        for done, t1 in enumerate(terms1, 1):
             for t2 in terms2:
                 for p in self.__hierarchy.pedigree_paths(t1, t2):
                     if len(p) == 1: 
@@ -91,6 +162,8 @@ class GeneAnalyser:
                     if tp not in seen:
                         seen.add(tp) 
                         out.append(p)
+            if progress is not None:
+                progress(done, len(terms1))
         return out
     
     def shortest_gene_path(self, gene1: str, gene2: str) -> list[str] | None:
@@ -120,14 +193,45 @@ class GeneAnalyser:
 
         return None
 
+    def gene_subgraph(self, genes, relations=None, up: bool = True, down: bool = False, go_ids=()) -> dict:
+        # sub-DAG around every term annotated to the genes (same row mask as the other gene
+        # queries), optionally seeded with extra terms
+        seeds = self.__hierarchy.terms_to_bits(go_ids)
+        for gene in genes:
+            seeds |= self.gene_term_bits(gene)
+        return self.__hierarchy.subgraph_from_bits(seeds, relations, up, down)
+
 
 
     
 
 class NumericalAnalysis(ABC):
-    def __init__(self, ontology_df : pd.DataFrame, annotation_df : pd.DataFrame):
+    def __init__(self, ontology_df : pd.DataFrame, annotation_df : pd.DataFrame | AnnotationStore, mask=None):
         self._ontology = ontology_df
         self._annotations = annotation_df
+        self._mask = mask   # optional boolean row mask (filters.AnnotationMasks), None = every row
+        self._selection: dict[tuple, pd.DataFrame] = {}   # columns -> masked rows, read-only
+
+    def _selected(self, *columns) -> pd.DataFrame:
+        # masked once per column set (rows and columns in a single take), reused until the annotations change
+        if isinstance(self._annotations, AnnotationStore):
+            # decoded on demand from the memory-mapped codes, not kept
+            return self._annotations.frame(columns, self._mask)
+        selected = self._selection.get(columns)
+        if selected is None:
+            cols = list(columns) if columns else slice(None)
+            df = self._annotations
+            selected = df.loc[:, cols] if self._mask is None else df.loc[self._mask, cols]
+            self._selection[columns] = selected
+        return selected
+
+    def update_annotations(self, annotation_df: pd.DataFrame, mask=None) -> None:
+        self._annotations = annotation_df
+        self._mask = mask
+        self._selection = {}
+
+    def update_ontology(self, ontology_df: pd.DataFrame) -> None:
+        self._ontology = ontology_df
 
     @property
     @abstractmethod
@@ -136,8 +240,8 @@ class NumericalAnalysis(ABC):
 
 
 class SummaryStatistics(NumericalAnalysis):
-    def __init__(self, ontology_df, annotation_df, term: TermCollection):
-        super().__init__(ontology_df, annotation_df)
+    def __init__(self, ontology_df, annotation_df, term: TermCollection, mask=None):
+        super().__init__(ontology_df, annotation_df, mask)
         self.__term = term
         
     @property
@@ -157,10 +261,11 @@ class SummaryStatistics(NumericalAnalysis):
         onto_df["n_children"] = children_info["n_children"]
         onto_df["is_leaf"] = children_info["is_leaf"]
         leaf_count = onto_df["is_leaf"].sum()
-        ann_df = self._annotations.copy()
+        ann_df = self._selected("gene_id", "evidence").copy()
+        # categorical when read from an AnnotationStore: counted as plain values so ties keep file order
+        ann_df["evidence"] = ann_df["evidence"].astype(object)
 
-        experimental_codes = {"EXP","IDA","IPI","IMP","IGI","IEP"}
-        ann_df["is_experimental"] = ann_df["evidence"].isin(experimental_codes)
+        ann_df["is_experimental"] = ann_df["evidence"].isin(EXPERIMENTAL_CODES)
         
         return {
             "namespace counts": onto_df["namespace"].value_counts(),
@@ -173,6 +278,27 @@ class SummaryStatistics(NumericalAnalysis):
             "total_annotations": len(ann_df)
         }
     
+    def apply_delta(self, summary: dict, added_df: pd.DataFrame, removed_df: pd.DataFrame) -> dict:
+        # adjusts a compute() result for a GAF delta without re-running the ontology part;
+        # call update_annotations() with the post-delta DataFrame first
+        if self._mask is not None:
+            return self.compute
+
+        def shift(counts: pd.Series, plus: pd.Series, minus: pd.Series) -> pd.Series:
+            counts = counts.add(plus, fill_value=0).sub(minus, fill_value=0).astype(int)
+            return counts[counts > 0].sort_values(ascending=False)
+
+        summary = dict(summary)
+        summary["evidence counts"] = shift(summary["evidence counts"],
+                                           added_df["evidence"].value_counts(),
+                                           removed_df["evidence"].value_counts())
+        summary["experimental vs computational"] = shift(summary["experimental vs computational"],
+                                                         added_df["evidence"].isin(EXPERIMENTAL_CODES).value_counts(),
+                                                         removed_df["evidence"].isin(EXPERIMENTAL_CODES).value_counts())
+        summary["total_genes"] = self._annotations["gene_id"].nunique()
+        summary["total_annotations"] = len(self._annotations)
+        return summary
+
     def plots(self):
         summary = self.compute
     
@@ -189,26 +315,41 @@ class SummaryStatistics(NumericalAnalysis):
 
 
 class GeneSimilarityAnalysis(NumericalAnalysis):
-    def __init__(self, ontology_df, annotation_df):
-        super().__init__(ontology_df, annotation_df)
+    methods = ("jaccard", "semantic")
+    matrix_genes = 500   # most annotated genes kept in the recompute() matrix
+
+    def __init__(self, ontology_df, annotation_df, hierarchy: OntologyHierarchy | None = None, mask=None):
+        super().__init__(ontology_df, annotation_df, mask)
+        self.__hierarchy = hierarchy
         self.__sim = None  
         self.__gene2terms =None
+        self.__gene_sets = {}   # method -> gene -> term set
+        self.__postings = {}    # method -> term -> genes
+        self.__minhash = None
+        self.__matrix: BlockedSimilarityMatrix | None = None
         
     @property
     def compute(self):
         if self.__sim is not None:
             return self.__sim     
+        return self.recompute()
+
+    @property
+    def computed(self) -> bool:
+        return self.__sim is not None
 
+    def recompute(self, progress=None) -> pd.DataFrame:
         # gene × term table (binary)  
+        selected = self._selected("gene_name", "go_id")
         table = pd.crosstab(
-            self._annotations["gene_name"],
-            self._annotations["go_id"]
+            selected["gene_name"],
+            selected["go_id"]
         )
         
         # counts annotation per gene -> table with decreasing numbers top to bottom
         gene_counts = table.sum(axis=1)
         # most 500 annotated genes
-        top_genes = gene_counts.nlargest(500).index
+        top_genes = gene_counts.nlargest(self.matrix_genes).index
         # filters the table just to keep that 500 genes
         table = table.loc[top_genes]
         
@@ -224,18 +365,201 @@ class GeneSimilarityAnalysis(NumericalAnalysis):
                 union = np.logical_or(M[i], M[j]).sum()
 
                 sim[i, j] = intersection / union if union else 0  #jaccard similarity
+            if progress is not None:
+                progress(i + 1, n)
 
         self.__sim = pd.DataFrame(sim, index=table.index, columns=table.index)
         return self.__sim
 
-    def compare2genes(self, gene1, gene2):
+    def _gene2terms(self) -> dict[str, set[str]]:
         if self.__gene2terms is None:
             self.__gene2terms = (
-                self._annotations.groupby('gene_name')['go_id'].apply(set).to_dict()
+                self._selected('gene_name', 'go_id').groupby('gene_name')['go_id'].apply(set).to_dict()
             )
+        return self.__gene2terms
+
+    def warm(self, method: str = "jaccard") -> None:
+        # builds the term sets and postings neighbours() uses for this method ahead of the first query
+        self._sets_for(method)
+
+    def _sets_for(self, method: str) -> dict[str, set[str]]:
+        if method not in self.methods:
+            raise ValueError(f"Unknown similarity method: {method}")
+
+        if method not in self.__gene_sets:
+            if method == "jaccard":
+                sets = self._gene2terms()
+            else:
+                # semantic (simUI): jaccard over the term sets propagated up to the roots
+                if self.__hierarchy is None:
+                    raise ValueError("Semantic similarity needs an OntologyHierarchy")
+                sets = {gene: self._propagate(go_ids) for gene, go_ids in self._gene2terms().items()}
+
+            postings = {}
+            for gene, go_ids in sets.items():
+                for go_id in go_ids:
+                    postings.setdefault(go_id, []).append(gene)
+
+            self.__gene_sets[method] = sets
+            self.__postings[method] = postings
+        return self.__gene_sets[method]
+
+    def _propagate(self, go_ids: set[str]) -> set[str]:
+        bits = self.__hierarchy.terms_to_bits(go_ids)
+        for go_id in go_ids:
+            bits |= self.__hierarchy.ancestor_bits(go_id)
+        return set(self.__hierarchy.bits_to_terms(bits))
+
+    def refresh_genes(self, genes) -> None:
+        # after update_annotations(): recompute only what depends on the touched genes
+        genes = set(genes)
+        self.__minhash = None
+        self.__matrix = None   # the on-disk matrix describes the previous snapshot
+        if self.__gene2terms is not None:
+            self._refresh_sets(genes, self._grouped(genes))
+
+        # cached matrix: only rows/columns of touched genes
+        if self.__sim is not None and genes:
+            # recompute() never builds gene2terms, so the matrix genes are grouped here if needed
+            gene2terms = self.__gene2terms
+            if gene2terms is None:
+                gene2terms = self._grouped(set(self.__sim.index) | genes)
+            # genes left without annotations leave the matrix; a matrix below matrix_genes
+            # holds every gene, so new ones join it
+            index = [gene for gene in self.__sim.index if gene in gene2terms]
+            if len(self.__sim) < self.matrix_genes:
+                known = set(self.__sim.index)
+                index += sorted(gene for gene in genes if gene in gene2terms and gene not in known)
+                index = index[:self.matrix_genes]
+            self.__sim = self.__sim.reindex(index=index, columns=index, fill_value=0.0)
+            for gene in genes & set(index):
+                terms = gene2terms.get(gene, set())
+                row = []
+                for other in self.__sim.index:
+                    other_terms = gene2terms.get(other, set())
+                    union = len(terms | other_terms)
+                    row.append(len(terms & other_terms) / union if union else 0)
+                self.__sim.loc[gene, :] = row
+                self.__sim.loc[:, gene] = row
+
+    def _grouped(self, genes: set[str]) -> dict[str, set[str]]:
+        # term sets of the given genes straight from the (masked) annotation rows
+        df = self._annotations
+        touched = df["gene_name"].isin(genes).to_numpy()
+        if self._mask is not None:
+            touched = touched & self._mask
+        return df.loc[touched, ["gene_name", "go_id"]].groupby("gene_name")["go_id"].apply(set).to_dict()
+
+    def _refresh_sets(self, genes: set[str], fresh: dict[str, set[str]]) -> None:
+        for method in list(self.__gene_sets):
+            sets = self.__gene_sets[method]
+            postings = self.__postings[method]
+            for gene in genes:
+                for go_id in sets.get(gene, set()):
+                    postings[go_id].remove(gene)
+                    if not postings[go_id]:
+                        del postings[go_id]
+                if method != "jaccard":   # the jaccard sets are gene2terms itself, updated below
+                    if gene in fresh:
+                        sets[gene] = self._propagate(fresh[gene])
+                    else:
+                        sets.pop(gene, None)
+
+        for gene in genes:
+            if gene in fresh:
+                self.__gene2terms[gene] = fresh[gene]
+            else:
+                self.__gene2terms.pop(gene, None)
+
+        for method in self.__gene_sets:
+            sets = self.__gene_sets[method]
+            for gene in genes & sets.keys():
+                for go_id in sets[gene]:
+                    self.__postings[method].setdefault(go_id, []).append(gene)
+
+    def refresh_semantic(self, genes) -> None:
+        # after an ontology release: annotations are unchanged, only the propagated
+        # (semantic) term sets of genes on re-parented / removed terms move
+        if "semantic" not in self.__gene_sets:
+            return
+        sets = self.__gene_sets["semantic"]
+        postings = self.__postings["semantic"]
+        for gene in set(genes) & sets.keys():
+            for go_id in sets[gene]:
+                postings[go_id].remove(gene)
+                if not postings[go_id]:
+                    del postings[go_id]
+            sets[gene] = self._propagate(self.__gene2terms[gene])
+            for go_id in sets[gene]:
+                postings.setdefault(go_id, []).append(gene)
+
+    def neighbours(self, gene: str, k: int = 10, method: str = "jaccard") -> list[tuple[str, float]]:
+        sets = self._sets_for(method)
+        postings = self.__postings[method]
+        query = sets.get(gene)
+        if not query or k < 1:
+            return []
+        if method == "jaccard" and self.__matrix is not None and gene in self.__matrix:
+            return self.__matrix.neighbours(gene, k)
+
+        # rare terms first: a gene not met in the first i postings shares at most
+        # len(query) - i terms with the query, which bounds its best possible score
+        ordered = sorted(query, key=lambda t: len(postings[t]))
+        size = len(query)
+        best = []   # min-heap of (score, gene), ties broken by gene name
+        seen = {gene}
+
+        for i, go_id in enumerate(ordered):
+            if len(best) == k and (size - i) / size < best[0][0]:
+                break
+            for other in postings[go_id]:
+                if other in seen:
+                    continue
+                seen.add(other)
+
+                other_set = sets[other]
+                if len(best) == k and min(size, len(other_set)) / max(size, len(other_set)) < best[0][0]:
+                    continue
+                inter = len(query & other_set)
+                score = inter / (size + len(other_set) - inter)
+
+                item = (score, _Descending(other))
+                if len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+        return [(str(g), round(score, 3)) for score, g in sorted(best, key=lambda x: (-x[0], str(x[1])))]
+
+    def minhash_index(self, num_perm: int = 128, bands: int = 32) -> MinHashIndex:
+        # approximate index for genome-scale GAFs, rebuilt only when the parameters change
+        if self.__minhash is None or self.__minhash[0] != (num_perm, bands):
+            self.__minhash = ((num_perm, bands), MinHashIndex(self._selected("gene_name", "go_id"), num_perm, bands))
+        return self.__minhash[1]
+
+    def approximate_report(self, num_perm: int = 128, bands: int = 32, threshold: float = 0.5) -> dict:
+        return self.minhash_index(num_perm, bands).accuracy_report(self._gene2terms(), threshold)
+
+    def save_matrix(self, directory: str, block: int = 512, dtype: str = "uint8") -> BlockedSimilarityMatrix:
+        # every gene, not just the top 500 of compute; written block by block to disk
+        self.__matrix = BlockedSimilarityMatrix.build(self._gene2terms(), directory, block, dtype)
+        return self.__matrix
+
+    def attach_matrix(self, matrix: BlockedSimilarityMatrix | None) -> None:
+        # a matrix built from other annotations (older GAF, other filter) would answer silently wrong
+        if matrix is not None:
+            if matrix.fingerprint != BlockedSimilarityMatrix.annotation_fingerprint(self._gene2terms()):
+                raise ValueError("Similarity matrix was built from different annotations, rebuild it (python simmatrix.py)")
+        self.__matrix = matrix
+
+    def compare2genes(self, gene1, gene2):
+        if self.__matrix is not None and gene1 in self.__matrix and gene2 in self.__matrix:
+            return round(self.__matrix.get(gene1, gene2), 3)
+
+        gene2terms = self._gene2terms()
 
-        gene_1 = self.__gene2terms.get(gene1)
-        gene_2 = self.__gene2terms.get(gene2)
+        gene_1 = gene2terms.get(gene1)
+        gene_2 = gene2terms.get(gene2)
 
         if not gene_1 or not gene_2:
             return 0.0
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from annotations import *
+from parsers import GAFParser
+
+
+class AnnotationStore:
+    # on-disk columnar version of AnnotationCollection: every column is an int32 array of
+    # interned codes in its own .npy file, opened memory-mapped so queries only page in
+    # the rows they touch. GeneAnnotation objects are created per query, never kept.
+    # Read-only: it has the query API of AnnotationCollection but no apply_delta. meta.json
+    # records a fingerprint of the GAF it was built from.
+    columns = ("gene_id", "gene_name", "qualifier", "go_id", "aspect", "evidence", "molecule", "taxon")
+    indexed = ("gene_id", "gene_name", "go_id", "evidence")
+    chunk = 10_000   # rows materialised at a time when iterating
+
+    def __init__(self, directory: str) -> None:
+        self.__directory = directory
+
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.fingerprint: str = json.load(f)["fingerprint"]
+        with open(os.path.join(directory, "vocab.json")) as f:
+            self.__vocab: dict[str, list[str]] = json.load(f)
+        self.__codes = {col: {value: i for i, value in enumerate(values)}
+                        for col, values in self.__vocab.items()}
+
+        self.__columns = {col: np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r")
+                          for col in self.columns}
+        self.__indexes = {col: (np.load(os.path.join(directory, f"by_{col}.npy"), mmap_mode="r"),
+                                np.load(os.path.join(directory, f"by_{col}_offsets.npy")))
+                          for col in self.indexed}
+
+        self.__term_collection: TermCollection | None = None
+        self.__ranks: dict[str, np.ndarray] = {}   # column -> sort rank of each code
+
+    @staticmethod
+    def file_fingerprint(gaf_path: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(gaf_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, gaf_path: str, directory: str, fingerprint: str | None = None) -> "AnnotationStore":
+        # written to a staging directory next to the target and renamed into place, so workers
+        # that have the old columns memory-mapped keep reading a consistent store
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".annotations-", dir=parent)
+        try:
+            cls._write(gaf_path, staging)
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump({"fingerprint": fingerprint or cls.file_fingerprint(gaf_path)}, f)
+            os.chmod(staging, 0o755)
+            cls._swap(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls(directory)
+
+    @staticmethod
+    def _swap(staging: str, directory: str) -> None:
+        if not os.path.exists(directory):
+            os.rename(staging, directory)
+            return
+        old = staging + ".old"
+        os.rename(directory, old)
+        os.rename(staging, directory)
+        shutil.rmtree(old)
+
+    @classmethod
+    def _write(cls, gaf_path: str, directory: str) -> None:
+        # streams the GAF once; only the int columns and the string vocabularies live in RAM
+        codes = {col: {} for col in cls.columns}
+        data = {col: array("i") for col in cls.columns}
+
+        for row in GAFParser(gaf_path).iter_rows():
+            for col in cls.columns:
+                lookup = codes[col]
+                code = lookup.get(row[col])
+                if code is None:
+                    code = lookup[row[col]] = len(lookup)
+                data[col].append(code)
+
+        for col in cls.columns:
+            np.save(os.path.join(directory, f"{col}.npy"), np.frombuffer(data[col], dtype=np.int32))
+
+        # sorted index per queried column: row ids grouped by code + offsets into them
+        for col in cls.indexed:
+            values = np.frombuffer(data[col], dtype=np.int32)
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            offsets = np.zeros(len(codes[col]) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(values, minlength=len(codes[col])), out=offsets[1:])
+            np.save(os.path.join(directory, f"by_{col}.npy"), order)
+            np.save(os.path.join(directory, f"by_{col}_offsets.npy"), offsets)
+
+        with open(os.path.join(directory, "vocab.json"), "w") as f:
+            json.dump({col: list(lookup) for col, lookup in codes.items()}, f)
+
+    def __len__(self) -> int:
+        return len(self.__columns["go_id"])
+
+    def __iter__(self):
+        return self.iter_rows(range(len(self)))
+
+    def __repr__(self) -> str:
+        return f"<AnnotationStore: {len(self)} annotations in {self.__directory}>"
+
+    def codes(self, column: str) -> np.ndarray:
+        # memory-mapped int32 codes of one column, decoded through values(column)
+        return self.__columns[column]
+
+    def values(self, column: str) -> list[str]:
+        return self.__vocab[column]
+
+    def frame(self, columns=(), mask=None) -> pd.DataFrame:
+        # the (masked) rows as categorical columns over the codes: a few bytes per row and
+        # cell, no string objects, for the pandas-based analysers. Categories are sorted so
+        # groupby / crosstab order rows like they do on the parsed DataFrame
+        rows = None if mask is None else np.flatnonzero(mask)
+        data = {}
+        for col in columns or self.columns:
+            codes = np.asarray(self.__columns[col] if rows is None else self.__columns[col][rows])
+            values = pd.Categorical.from_codes(codes, self.__vocab[col]).remove_unused_categories()
+            data[col] = values.reorder_categories(sorted(values.categories))
+        return pd.DataFrame(data)
+
+    def link_terms(self, term_collection: TermCollection) -> None:
+        # terms are linked when rows are materialised
+        self.__term_collection = term_collection
+
+    # mask: optional boolean row mask over the store rows (filters.AnnotationMasks)
+    def _rows(self, column: str, value: str, mask=None) -> np.ndarray:
+        code = self.__codes[column].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int32)
+        order, offsets = self.__indexes[column]
+        rows = np.asarray(order[offsets[code]:offsets[code + 1]])
+        return rows if mask is None else rows[mask[rows]]
+
+    def _rank(self, column: str) -> np.ndarray:
+        # position of every code in the sorted vocabulary, so rows sort without decoding strings
+        if column not in self.__ranks:
+            values = self.__vocab[column]
+            rank = np.empty(len(values), dtype=np.int32)
+            rank[sorted(range(len(values)), key=values.__getitem__)] = np.arange(len(values), dtype=np.int32)
+            self.__ranks[column] = rank
+        return self.__ranks[column]
+
+    def rows_by(self, field: str, value: str, sort_by: str | None = None, mask=None) -> np.ndarray:
+        if field in self.indexed:
+            rows = self._rows(field, value, mask)
+        else:
+            code = self.__codes[field].get(value, -1)
+            keep = self.__columns[field] == code
+            if mask is not None:
+                keep &= mask
+            rows = np.flatnonzero(keep)
+        if sort_by:
+            rows = rows[np.argsort(self._rank(sort_by)[self.__columns[sort_by][rows]], kind="stable")]
+        return rows
+
+    def page(self, rows, page: int, per_page: int) -> list[GeneAnnotation]:
+        start = (page - 1) * per_page
+        return self._materialise(np.asarray(rows[start:start + per_page], dtype=np.int64))
+
+    def iter_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), self.chunk):
+            yield from self._materialise(rows[start:start + self.chunk])
+
+    def _materialise(self, rows: np.ndarray) -> list[GeneAnnotation]:
+        values = {col: [self.__vocab[col][c] for c in self.__columns[col][rows].tolist()]
+                  for col in self.columns}
+
+        out = []
+        for i in range(len(rows)):
+            ann = GeneAnnotation(**{col: values[col][i] for col in self.columns})
+            if self.__term_collection is not None:
+                ann.link_term(self.__term_collection)
+            out.append(ann)
+        return out
+
+    def count_by_gene_name(self, gene_name: str) -> int:
+        return len(self._rows("gene_name", gene_name))
+
+    def count_by_term(self, go_id: str) -> int:
+        return len(self._rows("go_id", go_id))
+
+    def get_by_gene_id(self, gene_id: str, mask=None) -> list[GeneAnnotation]:
+        return self._materialise(self._rows("gene_id", gene_id, mask))
+
+    def get_by_gene_name(self, gene_name: str, mask=None) -> list[GeneAnnotation]:
+        return self._materialise(self._rows("gene_name", gene_name, mask))
+
+    def get_by_term(self, go_id: str, mask=None) -> list[GeneAnnotation]:
+        return self._materialise(self._rows("go_id", go_id, mask))
+
+    def get_by_evidence(self, evidence: str, mask=None) -> list[GeneAnnotation]:
+        return self._materialise(self._rows("evidence", evidence, mask))
+
+    def get_by_aspect(self, aspect: str, mask=None) -> list[GeneAnnotation]:
+        # not indexed (three values), so this one scans the aspect column
+        code = self.__codes["aspect"].get(aspect)
+        if code is None:
+            return []
+        keep = self.__columns["aspect"] == code
+        if mask is not None:
+            keep &= mask
+        return self._materialise(np.flatnonzero(keep))
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from ontology import *
 
 class GeneAnnotation:
@@ -9,7 +10,8 @@ class GeneAnnotation:
                      qualifier: str | None = None,  
                      aspect: str | None = None, 
                      evidence: str | None = None, 
-                     molecule: str = "protein" ):    
+                     molecule: str = "protein",
+                     taxon: str | None = None):    
             
             self.__gene_id = gene_id
             self.__gene_name = gene_name
@@ -18,10 +20,15 @@ class GeneAnnotation:
             self.__aspect = aspect
             self.__evidence = evidence
             self.__molecule = molecule
+            self.__taxon = taxon
             self.__branch = self.branch_map.get(aspect, "Unknown")
 
             self.__term: Term | None = None     
 
+        @property
+        def gene_id(self) -> str:
+            return self.__gene_id
+
         @property
         def gene_name(self) -> str:
             return self.__gene_name
@@ -50,14 +57,17 @@ class GeneAnnotation:
         def molecule(self) -> str:
             return self.__molecule
 
+        @property
+        def taxon(self) -> str | None:
+            return self.__taxon
+
         @property 
         def term(self) -> Term | None:
             return self.__term
 
         def link_term(self, term_collection: "TermCollection") -> None:
-            term = term_collection.get_term(self.go_id)
-            if term != None:
-                self.__term = term
+            # None when the term is missing, e.g. obsoleted by a new ontology release
+            self.__term = term_collection.get_term(self.go_id)
 
 
         def __repr__(self) -> str:
@@ -65,10 +75,14 @@ class GeneAnnotation:
 
 
 class AnnotationCollection: 
+    sorted_cache_size = 64   # sorted row lists kept for paging
 
     def __init__(self) -> None:
         # internal mutable storage
         self._annotations: list[GeneAnnotation] = []
+        # lazy lookup indexes, dropped whenever an annotation is added
+        self._index: dict[str, dict[str, list[int]]] = {}    # field -> value -> row ids
+        self._sorted: OrderedDict[tuple, list[int]] = OrderedDict()   # LRU: (field, value, sort_by) -> row ids
 
     @property
     def annotations(self) -> list[GeneAnnotation]:
@@ -85,25 +99,71 @@ class AnnotationCollection:
 
     def add_annotation(self, annotation: GeneAnnotation) -> None:
         self._annotations.append(annotation)
+        self._index.clear()
+        self._sorted.clear()
+
+    def apply_delta(self, removed_rows, added: list[GeneAnnotation]) -> None:
+        # drops the given row ids and appends the new annotations at the end, the same way
+        # the annotation DataFrame is updated, so row ids stay aligned with it
+        removed = set(removed_rows)
+        self._annotations = [ann for i, ann in enumerate(self._annotations) if i not in removed] + list(added)
+        self._index.clear()
+        self._sorted.clear()
 
     def link_terms(self, term_collection: "TermCollection") -> None:
         for ann in self.annotations:
             ann.link_term(term_collection)
 
-    def get_by_gene_id(self, gene_id: str) -> list[GeneAnnotation]: 
-        return [ann for ann in self._annotations if ann.gene_id == gene_id]
-
-    def get_by_gene_name(self, gene_name: str) -> list[GeneAnnotation]:  
-        return [ann for ann in self._annotations if ann.gene_name == gene_name]
-
-    def get_by_term(self, go_id: str) -> list[GeneAnnotation]: 
-        return [ann for ann in self._annotations if ann.go_id == go_id]
-
-    def get_by_aspect(self, aspect: str) -> list[GeneAnnotation]: 
-        return [ann for ann in self._annotations if ann.aspect == aspect]
-
-    def get_by_evidence(self, evidence: str) -> list[GeneAnnotation]: 
-        return [ann for ann in self._annotations if ann.evidence == evidence]
+    def _rows(self, field: str, value: str) -> list[int]:
+        if field not in self._index:
+            index: dict[str, list[int]] = {}
+            for i, ann in enumerate(self._annotations):
+                index.setdefault(getattr(ann, field), []).append(i)
+            self._index[field] = index
+        return self._index[field].get(value, [])
+
+    # mask: optional boolean row mask (see filters.AnnotationMasks), row i = i-th annotation added
+    def _take(self, rows: list[int], mask=None) -> list[GeneAnnotation]:
+        return [self._annotations[i] for i in rows if mask is None or mask[i]]
+
+    def rows_by(self, field: str, value: str, sort_by: str | None = None, mask=None) -> list[int]:
+        # row ids for one gene/term/..., optionally ordered by another field; the order of the
+        # most recently paged lists is cached so paging through a large term doesn't re-sort it
+        rows = self._rows(field, value)
+        if sort_by:
+            key = (field, value, sort_by)
+            if key in self._sorted:
+                self._sorted.move_to_end(key)
+                rows = self._sorted[key]
+            else:
+                rows = sorted(rows, key=lambda i: getattr(self._annotations[i], sort_by) or "")
+                self._sorted[key] = rows
+                if len(self._sorted) > self.sorted_cache_size:
+                    self._sorted.popitem(last=False)
+        return rows if mask is None else [i for i in rows if mask[i]]
+
+    def page(self, rows: list[int], page: int, per_page: int) -> list[GeneAnnotation]:
+        start = (page - 1) * per_page
+        return self._take(rows[start:start + per_page])
+
+    def iter_rows(self, rows: list[int]):
+        for i in rows:
+            yield self._annotations[i]
+
+    def get_by_gene_id(self, gene_id: str, mask=None) -> list[GeneAnnotation]: 
+        return self._take(self._rows("gene_id", gene_id), mask)
+
+    def get_by_gene_name(self, gene_name: str, mask=None) -> list[GeneAnnotation]:  
+        return self._take(self._rows("gene_name", gene_name), mask)
+
+    def get_by_term(self, go_id: str, mask=None) -> list[GeneAnnotation]: 
+        return self._take(self._rows("go_id", go_id), mask)
+
+    def get_by_aspect(self, aspect: str, mask=None) -> list[GeneAnnotation]: 
+        return self._take(self._rows("aspect", aspect), mask)
+
+    def get_by_evidence(self, evidence: str, mask=None) -> list[GeneAnnotation]: 
+        return self._take(self._rows("evidence", evidence), mask)
 
     def __repr__(self):
         return f"<AnnotationCollection: {len(self.annotations)} annotations>"
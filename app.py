@@ -1,95 +1,24 @@
-from flask import Flask, render_template, request
-from parsers import OBOParser, GAFParser
-from ontology import Term, TermCollection
-from annotations import GeneAnnotation, AnnotationCollection
-from hierarchy import OntologyHierarchy
+import json
+import os
+import tempfile
+from flask import Flask, Response, jsonify, render_template, request, stream_template, stream_with_context
 from analysis import *
+from loader import load_data
+from annotation_store import AnnotationStore
+from updates import AnnotationUpdater, OntologyUpdater
+from jobs import JobQueue, JobQueueFull
+from profiling import RequestProfiler
+from search import SearchIndex
 
 # initialize app
 app = Flask(__name__)
+app.config['ENABLE_GAF_UPDATES'] = os.environ.get('ENABLE_GAF_UPDATES') == '1'
+app.config['ENABLE_ONTOLOGY_UPDATES'] = os.environ.get('ENABLE_ONTOLOGY_UPDATES') == '1'
 
-def load_data():
-    # parse the files
-    print('parsing start')
-    obo_df = OBOParser("gene ontology.txt").parse()
-    gaf_df = GAFParser("gaf.txt").parse()
-    print('parsing done')
-
-    # build ontology
-    terms = TermCollection()
-
-    for _, row in obo_df.iterrows():
-        term = Term(
-            go_id=row["go_id"],
-            name=row["name"],
-            namespace=row["namespace"],
-            is_a=row["parents"],
-            definition=row["definition"],
-            synonyms=row["synonyms"]
-        )
-        terms.add_term(term)
-
-    print('term relationship is being made')
-    terms.build_vertical_relationship()
-    print('term relationship made')
-
-    # build annotations
-    print('annotation starts')
-    annotations = AnnotationCollection()
-
-    for _, row in gaf_df.iterrows():
-        ann = GeneAnnotation(
-            gene_id=row["gene_id"],
-            gene_name=row["gene_name"],
-            go_id=row["go_id"],
-            aspect=row["aspect"],
-            evidence=row["evidence"],
-            qualifier=row['qualifier'],
-            molecule=row["molecule"]
-        )
-        annotations.add_annotation(ann)
-
-    print('annotation made')
-
-    print('linking on process')
-    annotations.link_terms(terms)
-    print('links made')
-
-    # build hierarchy
-    print('building hierarchy')
-    hierarchy = OntologyHierarchy(terms)
-    hierarchy.build_tree()
-    print('hierarchy tree done')
-
-    # build analysers
-    print('start analysing')
-    gene_analyser = GeneAnalyser(annotations, terms, hierarchy)
-    print('finish analysing')
-
-    #stat
-    print('start summary')
-    summary= SummaryStatistics(obo_df, gaf_df, terms).compute
-    print('finish summary')
-
-    #similarity analysis
-    print('similaity start')
-    similarity_analyser=GeneSimilarityAnalysis(obo_df,gaf_df)
-    print('similarity finish')
-
-    # return structured data
-    return {
-        "ontology_df": obo_df,
-        "annotation_df": gaf_df,
-        "term_collection": terms,
-        'annotations': annotations,
-        'hierarchy': hierarchy,
-        "gene_analyser": gene_analyser,
-        "summary": summary,
-        'similarity_analyser':similarity_analyser}
-    
+PER_PAGE = 50       # annotations per page on /gene and /term
+MAX_PER_PAGE = 500
 
-
-data = load_data()
+data = load_data(matrix_dir=os.environ.get('SIMILARITY_MATRIX'), store_dir=os.environ.get('ANNOTATION_STORE'))
 hierarchy=data['hierarchy']
 gene_analyser=data['gene_analyser']
 terms=data['term_collection']
@@ -98,6 +27,18 @@ similarity_analyser = data['similarity_analyser']
 ontology_df= data['ontology_df']
 annotation_df= data ['annotation_df']
 summary=data['summary']
+search_index = data['search_index']
+updater = AnnotationUpdater(data)
+ontology_updater = OntologyUpdater(data)
+# opt-in request profiling (X-Profile: 1 header, ?profile=1 or sampling); no hooks at all when off
+if os.environ.get('PROFILING') == '1':
+    RequestProfiler(app,
+                    output_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+                    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+                    mode=os.environ.get('PROFILE_MODE', 'cprofile'),
+                    endpoints=('gene_page', 'term_page', 'analyse_terms', 'analyse_genes', 'neighbours', 'stats'))
+job_queue = JobQueue(max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                     max_pending=int(os.environ.get('JOB_MAX_PENDING', 50)))
 
 
     
@@ -108,25 +49,60 @@ def home():
     return render_template('index.html')
 
 
+def page_args(sort_fields: tuple[str, ...]) -> tuple[int, int, str | None]:
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    sort = request.args.get('sort')
+    return page, per_page, sort if sort in sort_fields else None
+
+
+def ndjson_response(rows: list[int]) -> Response:
+    # one annotation per line, generated lazily so memory stays flat for huge terms
+    def generate():
+        for ann in annotations.iter_rows(rows):
+            yield json.dumps({
+                'gene_id': ann.gene_id,
+                'gene_name': ann.gene_name,
+                'go_id': ann.go_id,
+                'term_name': ann.term.name if ann.term else None,
+                'qualifier': ann.qualifier,
+                'evidence': ann.evidence,
+                'aspect': ann.aspect,
+                'taxon': ann.taxon,
+                'molecule': ann.molecule
+            }) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.route("/gene") 
 def gene_page(): 
     gene_name = request.args.get("gene_name") 
+    page, per_page, sort = page_args(('go_id', 'evidence', 'aspect', 'qualifier'))
  
-    gene_annotations = [] 
+    rows = []
     gene_spec= None
 
     if gene_name: 
-        gene_annotations = annotations.get_by_gene_name(gene_name) 
-        print(f"Searching for gene: {gene_name}, found {len(gene_annotations)} annotations") 
+        rows = annotations.rows_by('gene_name', gene_name, sort)
+        print(f"Searching for gene: {gene_name}, found {len(rows)} annotations") 
+
+    if request.args.get('format') == 'ndjson':
+        return ndjson_response(rows)
     
-    if gene_name and gene_annotations: 
+    if gene_name and rows: 
         gene_spec = gene_analyser.gene_specificity(gene_name)
 
-    return render_template(
+    return stream_template(
         "gene.html",
         gene_name=gene_name,
-        annotations=gene_annotations,
-        gene_spec=gene_spec
+        annotations=annotations.page(rows, page, per_page),
+        gene_spec=gene_spec,
+        total=len(rows),
+        page=page,
+        pages=(len(rows) + per_page - 1) // per_page,
+        per_page=per_page,
+        sort=sort
     )
 
 
@@ -134,20 +110,29 @@ def gene_page():
 @app.route("/term")
 def term_page():
     go_id = request.args.get("go_id")
+    page, per_page, sort = page_args(('gene_name', 'evidence', 'qualifier'))
 
     term = None
-    genes_for_term = []
+    rows = []
 
     if go_id:
         term = terms.get_term(go_id)  
         if term:
-            genes_for_term = annotations.get_by_term(go_id)
+            rows = annotations.rows_by('go_id', go_id, sort)
 
-    return render_template(
+    if request.args.get('format') == 'ndjson':
+        return ndjson_response(rows)
+
+    return stream_template(
         "term.html",
         go_id=go_id,
         term=term,
-        genes_for_term=genes_for_term
+        genes_for_term=annotations.page(rows, page, per_page),
+        total=len(rows),
+        page=page,
+        pages=(len(rows) + per_page - 1) // per_page,
+        per_page=per_page,
+        sort=sort
     )
     
 
@@ -155,6 +140,7 @@ def term_page():
 def analyse_terms():
     result = None
     error = None
+    warning = None
     go1 = go2 = None
 
     if request.method =='POST': 
@@ -176,18 +162,19 @@ def analyse_terms():
                 'ancestor' : hierarchy.is_ancestor(go1, go2) ,
                 "descendant": hierarchy.is_descendant(go1,go2),
                 "msca": hierarchy.MSCA(go1,go2),
-                'paths': hierarchy.pedigree_paths(go1,go2),
-                'altpaths':hierarchy.pedigree_paths(go2,go1),
-                "shortest_path": hierarchy.shortest_path(go1,go2),
-                'altshortest_path': hierarchy.shortest_path(go2,go1),
-                'longest_path':hierarchy.longest_path(go1,go2),
-                'altlongest_path': hierarchy.longest_path(go2,go1)
+                'job': None
             }
+            # path listings can be huge: computed in the job pool, the page polls for them
+            try:
+                result['job'] = job_queue.submit('term_path_listing', term_path_listing_job, go1, go2).id
+            except JobQueueFull as e:
+                warning = f"Paths not computed: {e}"
 
  
     return render_template ('analyse_terms.html',
                             result=result ,
                             error=error,
+                            warning=warning,
                             go1=go1,
                             go2=go2)
 
@@ -196,6 +183,7 @@ def analyse_terms():
 def analyse_genes():
     result= None
     error = None
+    warning = None
     gene1 = gene2 = None
     
     if request.method == "POST":
@@ -216,23 +204,208 @@ def analyse_genes():
                 'related': gene_analyser.genes_functionally_related(gene1,gene2),
                 "ancestor": gene_analyser.is_gene_ancestor(gene1, gene2),
                 "descendant": gene_analyser.is_gene_descendant(gene1, gene2),
-                "paths": gene_analyser.gene_paths(gene1,gene2),
-                'altpaths': gene_analyser.gene_paths(gene2,gene1),
-                "shortest_path": gene_analyser.shortest_gene_path(gene1, gene2),
-                'longest_path': gene_analyser.longest_gene_path(gene1, gene2),
-                'altshortest_path': gene_analyser.shortest_gene_path(gene2,gene1),
-                'altlongest_path':gene_analyser.longest_gene_path(gene2,gene1),
                 'msca': gene_analyser.MSCA(gene1,gene2),
-                'similarity_score': similarity_analyser.compare2genes(gene1,gene2)
+                'similarity_score': similarity_analyser.compare2genes(gene1,gene2),
+                'job': None
             }
+            # path listings can be huge: computed in the job pool, the page polls for them
+            try:
+                result['job'] = job_queue.submit('gene_path_listing', gene_path_listing_job, gene1, gene2).id
+            except JobQueueFull as e:
+                warning = f"Paths not computed: {e}"
 
     return render_template("analyse_genes.html",
                            result=result,
                            error= error,
+                           warning=warning,
                            gene1=gene1,
                            gene2=gene2
                           )
 
+@app.route('/neighbours')
+def neighbours():
+    gene_name = request.args.get('gene_name')
+    method = request.args.get('method', 'jaccard')
+    k = request.args.get('k', 10, type=int)
+
+    if not gene_name:
+        return jsonify({'error': 'gene_name is required'}), 400
+    if method not in GeneSimilarityAnalysis.methods:
+        return jsonify({'error': f'Unknown method {method}'}), 400
+
+    hits = similarity_analyser.neighbours(gene_name, k=k, method=method)
+    return jsonify({
+        'gene_name': gene_name,
+        'method': method,
+        'neighbours': [{'gene': g, 'similarity': score} for g, score in hits]
+    })
+
+@app.route('/search')
+def search():
+    # autocomplete for the gene / term boxes: prefix matches first, then fuzzy ones
+    query = request.args.get('q', '')
+    kind = request.args.get('kind') or None
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+    if kind is not None and kind not in SearchIndex.kinds:
+        return jsonify({'error': f'Unknown kind {kind}'}), 400
+    return jsonify({
+        'query': query,
+        'results': search_index.search(query, limit=limit, kind=kind)
+    })
+
+@app.route('/subgraph')
+def subgraph():
+    # DAG neighbourhood of ?go_id=...&go_id=... or ?gene_name=..., as json / dot / edges
+    go_ids = request.args.getlist('go_id')
+    genes = request.args.getlist('gene_name')
+    direction = request.args.get('direction', 'up')
+    fmt = request.args.get('format', 'json')
+    relations = request.args.get('relations')
+
+    if not go_ids and not genes:
+        return jsonify({'error': 'go_id or gene_name is required'}), 400
+    if direction not in ('up', 'down', 'both'):
+        return jsonify({'error': f'Unknown direction {direction}'}), 400
+    if fmt not in OntologyHierarchy.subgraph_formats:
+        return jsonify({'error': f'Unknown format {fmt}'}), 400
+    missing = [go_id for go_id in go_ids if terms.get_term(go_id) is None]
+    if missing:
+        return jsonify({'error': f'GO ID {missing[0]} not found'}), 404
+
+    up, down = direction in ('up', 'both'), direction in ('down', 'both')
+    try:
+        relations = relations.split(',') if relations else None
+        if genes:
+            graph = gene_analyser.gene_subgraph(genes, relations, up, down, go_ids=go_ids)
+        else:
+            graph = hierarchy.subgraph(go_ids, relations, up, down)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if fmt == 'json':
+        return jsonify(graph)
+    mimetype = 'text/vnd.graphviz' if fmt == 'dot' else 'text/tab-separated-values'
+    return Response(hierarchy.export_subgraph(graph, fmt), mimetype=mimetype)
+
+# background jobs: slow analyses run in the job pool, the client polls for progress/result
+
+def pedigree_paths_job(go1, go2, progress=None):
+    return hierarchy.pedigree_paths(go1, go2, progress=progress)
+
+def gene_paths_job(gene1, gene2, progress=None):
+    return gene_analyser.gene_paths(gene1, gene2, progress=progress)
+
+def path_listing(paths, altpaths):
+    # what the analyse pages show: both directions, shortest / longest picked from the listings
+    return {
+        'paths': paths,
+        'altpaths': altpaths,
+        'shortest_path': min(paths, key=len) if paths else None,
+        'longest_path': max(paths, key=len) if paths else None,
+        'altshortest_path': min(altpaths, key=len) if altpaths else None,
+        'altlongest_path': max(altpaths, key=len) if altpaths else None
+    }
+
+def term_path_listing_job(go1, go2, progress=None):
+    return path_listing(hierarchy.pedigree_paths(go1, go2, progress=progress), hierarchy.pedigree_paths(go2, go1))
+
+def gene_path_listing_job(gene1, gene2, progress=None):
+    return path_listing(gene_analyser.gene_paths(gene1, gene2, progress=progress), gene_analyser.gene_paths(gene2, gene1))
+
+def similarity_job(progress=None):
+    matrix = similarity_analyser.recompute(progress)
+    return {'genes': len(matrix)}
+
+JOB_TYPES = {
+    'pedigree_paths': (pedigree_paths_job, ('go1', 'go2')),
+    'gene_paths': (gene_paths_job, ('gene1', 'gene2')),
+    'term_path_listing': (term_path_listing_job, ('go1', 'go2')),
+    'gene_path_listing': (gene_path_listing_job, ('gene1', 'gene2')),
+    'similarity': (similarity_job, ())
+}
+
+@app.route('/jobs/<job_type>', methods=['POST'])
+def submit_job(job_type):
+    if job_type not in JOB_TYPES:
+        return jsonify({'error': f'Unknown job type {job_type}'}), 404
+    fn, params = JOB_TYPES[job_type]
+
+    args = tuple(request.values.get(p) for p in params)
+    missing = [p for p, a in zip(params, args) if not a]
+    if missing:
+        return jsonify({'error': f'Missing {", ".join(missing)}'}), 400
+
+    try:
+        job = job_queue.submit(job_type, fn, *args)
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    if job.status == 'failed':
+        return jsonify(job.to_dict()), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 202
+    return jsonify({**job.to_dict(), 'result': job.result})
+
+@app.route('/admin/gaf_delta', methods=['POST'])
+def gaf_delta():
+    # applies an uploaded "+line" / "-line" GAF delta without reloading; off unless enabled
+    if not app.config.get('ENABLE_GAF_UPDATES'):
+        return jsonify({'error': 'GAF updates are disabled'}), 403
+    if isinstance(annotations, AnnotationStore):
+        return jsonify({'error': 'GAF updates need in-memory annotations, unset ANNOTATION_STORE'}), 409
+    upload = request.files.get('delta')
+    if upload is None:
+        return jsonify({'error': 'delta file is required'}), 400
+
+    fd, path = tempfile.mkstemp(suffix='.gaf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            upload.save(f)
+        report = updater.apply_file(path)
+    finally:
+        os.remove(path)
+    return jsonify(report)
+
+@app.route('/admin/obo_release', methods=['POST'])
+def obo_release():
+    # diffs an uploaded GO release against the loaded one; applies it unless ?dry_run=1
+    if not app.config.get('ENABLE_ONTOLOGY_UPDATES'):
+        return jsonify({'error': 'Ontology updates are disabled'}), 403
+    upload = request.files.get('obo')
+    if upload is None:
+        return jsonify({'error': 'obo file is required'}), 400
+
+    fd, path = tempfile.mkstemp(suffix='.obo')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            upload.save(f)
+        diff = ontology_updater.diff(path)
+        if request.args.get('dry_run') == '1':
+            hierarchy.check_update(diff.new_terms(), diff.gone_ids)   # rejected like a real apply would be
+            report = diff.to_dict()
+        else:
+            report = ontology_updater.apply(diff)
+    except ValueError as e:
+        # e.g. a release whose is_a / relationship edges form a cycle, rejected before anything changes
+        return jsonify({'error': str(e)}), 409
+    finally:
+        os.remove(path)
+    return jsonify(report)
+
 @app.route('/stats')
 def stats():
     template_data = {
@@ -258,16 +431,21 @@ def stats():
     similarity_results = None
     warning = None
     
-    if min_val and max_val:
+    if min_val and max_val and not similarity_analyser.computed:
+        # the full matrix is slow: compute it in the background, identical requests share the job
+        try:
+            job = job_queue.submit('similarity', similarity_job)
+            warning = f"Similarity matrix is being computed (job {job.id}, {job.done}/{job.total or '?'} genes). Reload in a moment."
+        except JobQueueFull as e:
+            warning = f"Error: {str(e)}"
+
+    elif min_val and max_val:
         # Calcola similarità (stesso codice dell'API)
         try:
-            from analysis import GeneSimilarityAnalysis
-            
             min_val = float(min_val)
             max_val = float(max_val)
             
-            similarity = GeneSimilarityAnalysis(ontology_df, annotation_df)
-            matrix = similarity.compute
+            matrix = similarity_analyser.compute
             
             # Estrai coppie nel range
             results = []
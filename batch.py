@@ -0,0 +1,193 @@
+# offline batch runner:
+#   python batch.py terms pairs.tsv -o out.tsv          (GO ID pairs)
+#   python batch.py genes pairs.tsv -o out.parquet      (gene symbol pairs, parquet needs pyarrow)
+#   python batch.py neighbours genes.txt -o out.tsv -k 20 --method semantic
+# the snapshot is loaded once, the input is fanned out over a process pool and
+# results are streamed to the output in input order
+import argparse
+import contextlib
+import csv
+import multiprocessing as mp
+import os
+import sys
+from collections.abc import Iterator
+
+from loader import load_data
+
+_data: dict | None = None   # per-process snapshot, inherited on fork or loaded by _init
+
+
+def _init(obo_path: str, gaf_path: str, matrix_dir: str | None) -> None:
+    global _data
+    if _data is None:
+        with contextlib.redirect_stdout(sys.stderr):
+            _data = load_data(obo_path, gaf_path, matrix_dir)
+
+
+def _warm(mode: str, method: str) -> None:
+    # builds the lazy indexes a mode needs once in the parent, so forked workers share
+    # them instead of each building its own copy on the first item
+    if mode == "genes":
+        _data["gene_analyser"].build_index()
+        _data["similarity_analyser"].warm("jaccard")
+    elif mode == "neighbours":
+        _data["similarity_analyser"].warm(method)
+
+
+def _path(path: list[str] | None) -> str:
+    return "|".join(path) if path else ""
+
+
+def term_pair(pair: tuple[str, str]) -> list[list]:
+    go1, go2 = pair
+    hierarchy = _data["hierarchy"]
+    # one path enumeration for both ends, shortest_path/longest_path would each redo it
+    paths = hierarchy.pedigree_paths(go1, go2)
+    shortest = min(paths, key=len) if paths else None
+    longest = max(paths, key=len) if paths else None
+    return [[go1, go2,
+             hierarchy.is_related(go1, go2),
+             hierarchy.is_ancestor(go1, go2),
+             hierarchy.is_descendant(go1, go2),
+             hierarchy.MSCA(go1, go2) or "",
+             len(shortest) if shortest else 0,
+             _path(shortest),
+             _path(longest)]]
+
+
+def gene_pair(pair: tuple[str, str]) -> list[list]:
+    gene1, gene2 = pair
+    analyser = _data["gene_analyser"]
+    shortest = analyser.shortest_gene_path(gene1, gene2)
+    return [[gene1, gene2,
+             analyser.genes_functionally_related(gene1, gene2),
+             analyser.is_gene_ancestor(gene1, gene2),
+             analyser.is_gene_descendant(gene1, gene2),
+             analyser.MSCA(gene1, gene2) or "",
+             _data["similarity_analyser"].compare2genes(gene1, gene2),
+             _path(shortest)]]
+
+
+def gene_neighbours(item: tuple[str, int, str]) -> list[list]:
+    gene, k, method = item
+    hits = _data["similarity_analyser"].neighbours(gene, k=k, method=method)
+    return [[gene, rank, other, score] for rank, (other, score) in enumerate(hits, 1)]
+
+
+MODES = {
+    "terms": (term_pair, ["go1", "go2", "related", "ancestor", "descendant", "msca",
+                          "shortest_len", "shortest_path", "longest_path"]),
+    "genes": (gene_pair, ["gene1", "gene2", "related", "ancestor", "descendant", "msca",
+                          "similarity", "shortest_path"]),
+    "neighbours": (gene_neighbours, ["gene", "rank", "neighbour", "similarity"])
+}
+
+
+def read_items(path: str, mode: str, args) -> Iterator[tuple]:
+    # streams the input: two tab-separated columns for pairs, one gene per line for neighbours
+    with open(path) as f:
+        if args.header:
+            next(f, None)
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if mode == "neighbours":
+                yield fields[0].strip(), args.k, args.method
+            else:
+                if len(fields) < 2:
+                    raise ValueError(f"Expected two tab-separated columns: {line!r}")
+                yield fields[0].strip(), fields[1].strip()
+
+
+class TSVWriter:
+    def __init__(self, path: str, columns: list[str]) -> None:
+        self.__file = open(path, "w", newline="")
+        self.__writer = csv.writer(self.__file, delimiter="\t")
+        self.__writer.writerow(columns)
+
+    def write(self, rows: list[list]) -> None:
+        self.__writer.writerows(rows)
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class ParquetWriter:
+    # buffers rows and writes one row group per batch, so memory stays bounded
+    def __init__(self, path: str, columns: list[str], batch_size: int = 50_000) -> None:
+        try:
+            import pyarrow as pa      # optional dependency, only for .parquet output
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or write .tsv instead")
+        self.__pa = pa
+        self.__pq = pq
+        self.__path = path
+        self.__columns = columns
+        self.__batch_size = batch_size
+        self.__rows: list[list] = []
+        self.__writer = None
+
+    def write(self, rows: list[list]) -> None:
+        self.__rows.extend(rows)
+        if len(self.__rows) >= self.__batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.__rows:
+            return
+        table = self.__pa.table({col: [row[i] for row in self.__rows] for i, col in enumerate(self.__columns)})
+        if self.__writer is None:
+            self.__writer = self.__pq.ParquetWriter(self.__path, table.schema)
+        self.__writer.write_table(table)
+        self.__rows = []
+
+    def close(self) -> None:
+        self._flush()
+        if self.__writer is not None:
+            self.__writer.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run GO analyses over a file of term/gene pairs or genes.")
+    parser.add_argument("mode", choices=MODES)
+    parser.add_argument("input", help="TSV of pairs (terms/genes) or one gene per line (neighbours)")
+    parser.add_argument("-o", "--output", required=True, help="output .tsv or .parquet")
+    parser.add_argument("--obo", default="gene ontology.txt")
+    parser.add_argument("--gaf", default="gaf.txt")
+    parser.add_argument("--matrix", default=os.environ.get("SIMILARITY_MATRIX"),
+                        help="directory of a precomputed BlockedSimilarityMatrix")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument("--header", action="store_true", help="skip the first input line")
+    parser.add_argument("-k", type=int, default=10, help="neighbours per gene")
+    parser.add_argument("--method", default="jaccard", choices=("jaccard", "semantic"))
+    args = parser.parse_args(argv)
+
+    fn, columns = MODES[args.mode]
+    writer = (ParquetWriter if args.output.endswith(".parquet") else TSVWriter)(args.output, columns)
+    items = read_items(args.input, args.mode, args)
+
+    # load once in the parent; with fork the workers share it copy-on-write,
+    # elsewhere the initializer loads it again in each worker
+    _init(args.obo, args.gaf, args.matrix)
+    _warm(args.mode, args.method)
+    try:
+        if args.workers <= 1:
+            for rows in map(fn, items):
+                writer.write(rows)
+        else:
+            methods = mp.get_all_start_methods()
+            ctx = mp.get_context("fork" if "fork" in methods else None)
+            with ctx.Pool(args.workers, initializer=_init, initargs=(args.obo, args.gaf, args.matrix)) as pool:
+                # imap keeps input order while results stream out
+                for rows in pool.imap(fn, items, chunksize=args.chunksize):
+                    writer.write(rows)
+    finally:
+        writer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
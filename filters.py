@@ -0,0 +1,174 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+EXPERIMENTAL_CODES = {"EXP", "IDA", "IPI", "IMP", "IGI", "IEP"}
+
+
+class AnnotationMasks:
+    # one packed bitmask per (field, value) over the annotation rows. Rows are positional:
+    # row i is the i-th line of the annotation DataFrame and the i-th GeneAnnotation of the
+    # AnnotationCollection built from it (or row i of an AnnotationStore), so one mask works for all.
+    fields = ("evidence", "qualifier", "aspect", "taxon")
+
+    def __init__(self, annotation_df: pd.DataFrame) -> None:
+        self.__n = len(annotation_df)
+        self.__bits: dict[tuple[str, str], np.ndarray] = {}
+
+        for field in self.fields:
+            if field not in annotation_df:
+                continue
+            codes, values = pd.factorize(annotation_df[field].fillna("").reset_index(drop=True))
+            self._add_field(field, codes, list(values))
+
+    @classmethod
+    def from_store(cls, store) -> "AnnotationMasks":
+        # the same masks straight from the int code columns of an AnnotationStore (row i =
+        # store row i), without decoding any row
+        masks = cls.__new__(cls)
+        masks.__n = len(store)
+        masks.__bits = {}
+        for field in cls.fields:
+            masks._add_field(field, np.asarray(store.codes(field)), store.values(field))
+        return masks
+
+    def _add_field(self, field: str, codes: np.ndarray, values: list[str]) -> None:
+        # rows grouped by code with one stable sort, each mask is set from its codes' groups
+        order = np.argsort(codes, kind="stable")
+        bounds = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(values)), out=bounds[1:])
+
+        groups: dict[str, list[int]] = {}
+        for code, value in enumerate(values):
+            tokens = [value]
+            if field in ("qualifier", "taxon"):
+                # multi-valued columns ("NOT|enables", "taxon:9606|taxon:562"): one mask per token
+                tokens = value.split("|")
+                if field == "taxon":
+                    tokens = [token.replace("taxon:", "") for token in tokens]
+            for token in tokens:
+                groups.setdefault(token, []).append(code)
+
+        for token, token_codes in groups.items():
+            mask = np.zeros(self.__n, dtype=bool)
+            for code in token_codes:
+                mask[order[bounds[code]:bounds[code + 1]]] = True
+            self.__bits[(field, token)] = np.packbits(mask)
+
+    def __len__(self) -> int:
+        return self.__n
+
+    def apply_delta(self, keep: np.ndarray, added_df: pd.DataFrame) -> None:
+        # keep: boolean mask of surviving rows, added rows are appended after them
+        added = AnnotationMasks(added_df)
+        n = int(keep.sum()) + len(added)
+
+        for key in set(self.__bits) | set(added.__bits):
+            old = np.unpackbits(self.bits(*key), count=self.__n).view(bool)[keep]
+            new = np.unpackbits(added.bits(*key), count=len(added)).view(bool)
+            mask = np.concatenate([old, new])
+            if mask.any():
+                self.__bits[key] = np.packbits(mask)
+            else:
+                self.__bits.pop(key, None)
+        self.__n = n
+
+    def values(self, field: str) -> list[str]:
+        return sorted(value for f, value in self.__bits if f == field)
+
+    def bits(self, field: str, value: str) -> np.ndarray:
+        mask = self.__bits.get((field, value))
+        return mask if mask is not None else self.none()
+
+    def all(self) -> np.ndarray:
+        return np.packbits(np.ones(self.__n, dtype=bool))
+
+    def none(self) -> np.ndarray:
+        return np.zeros((self.__n + 7) // 8, dtype=np.uint8)
+
+    def select(self, annotation_filter: "AnnotationFilter") -> np.ndarray:
+        # boolean row mask, ready for df[mask] or the mask= argument of the analysers
+        packed = annotation_filter.packed(self)
+        return np.unpackbits(packed, count=self.__n).view(bool)
+
+    def rows(self, annotation_filter: "AnnotationFilter") -> np.ndarray:
+        return np.flatnonzero(self.select(annotation_filter))
+
+
+class AnnotationFilter(ABC):
+    # combine with & | ~, e.g. Evidence(*EXPERIMENTAL_CODES) & ~Qualifier("NOT") & Aspect("F")
+
+    @abstractmethod
+    def packed(self, masks: AnnotationMasks) -> np.ndarray:
+        ...
+
+    def __and__(self, other: "AnnotationFilter") -> "AnnotationFilter":
+        return _Combined(np.bitwise_and, self, other)
+
+    def __or__(self, other: "AnnotationFilter") -> "AnnotationFilter":
+        return _Combined(np.bitwise_or, self, other)
+
+    def __invert__(self) -> "AnnotationFilter":
+        return _Not(self)
+
+
+class FieldFilter(AnnotationFilter):
+    field = ""
+
+    def __init__(self, *values: str) -> None:
+        self.values = values
+
+    def packed(self, masks: AnnotationMasks) -> np.ndarray:
+        out = masks.none()
+        for value in self.values:
+            out = out | masks.bits(self.field, value)
+        return out
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}{self.values}"
+
+
+class Evidence(FieldFilter):
+    field = "evidence"
+
+
+class Qualifier(FieldFilter):
+    field = "qualifier"
+
+
+class Aspect(FieldFilter):
+    field = "aspect"
+
+
+class Taxon(FieldFilter):
+    field = "taxon"
+
+
+class AllAnnotations(AnnotationFilter):
+
+    def packed(self, masks: AnnotationMasks) -> np.ndarray:
+        return masks.all()
+
+
+class _Combined(AnnotationFilter):
+    def __init__(self, op, left: AnnotationFilter, right: AnnotationFilter) -> None:
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def packed(self, masks: AnnotationMasks) -> np.ndarray:
+        return self.op(self.left.packed(masks), self.right.packed(masks))
+
+
+class _Not(AnnotationFilter):
+    def __init__(self, inner: AnnotationFilter) -> None:
+        self.inner = inner
+
+    def packed(self, masks: AnnotationMasks) -> np.ndarray:
+        # padding bits past the last row get set too, unpackbits(count=n) drops them
+        return np.invert(self.inner.packed(masks))
+
+
+EXPERIMENTAL = Evidence(*EXPERIMENTAL_CODES)
+POSITIVE = ~Qualifier("NOT")   # default view for relatedness and similarity
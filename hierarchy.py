@@ -1,11 +1,34 @@
 from ontology import *
 from annotations import *
+from collections import OrderedDict
+import json
+import numpy as np
 
 class OntologyHierarchy:
+    # typed edges that point from a term to a more general one (has_part goes the other way)
+    relations = ("is_a", "part_of", "regulates", "positively_regulates", "negatively_regulates")
+    default_relations = ("is_a", "part_of")
+    subgraph_cache_size = 128
+    subgraph_formats = ("json", "dot", "edges")
 
     def __init__ (self, term_collection: TermCollection) -> None:
         self.__ontology = term_collection
         self.__hierarchy : dict[str, set[str]] = {}
+        # closure index: every term gets an integer position, ancestors/descendants are int bitsets
+        self.__index : dict[str, int] = {}
+        self.__ids : list[str] = []
+        # relation -> CSR arrays (indptr, indices) of parent / child positions
+        self.__parents_adj : dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.__children_adj : dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        # precomputed ancestor closure for default_relations, also CSR
+        self.__default_anc : tuple[np.ndarray, np.ndarray] | None = None
+        # longest path (in edges, over every relation) from a root, per position
+        self.__depth : np.ndarray = np.empty(0, dtype=np.int32)
+        # relation set -> position -> bitset, filled lazily
+        self.__anc_bits : dict[frozenset, dict[int, int]] = {}
+        self.__desc_bits : dict[frozenset, dict[int, int]] = {}
+        # (seed bits, relations, up, down) -> extracted subgraph, least recently used first
+        self.__subgraphs : OrderedDict[tuple, dict] = OrderedDict()
 
     def build_tree(self) -> dict[str, set[str]]:
         for go_id in self.__ontology.terms:
@@ -17,22 +40,365 @@ class OntologyHierarchy:
 
         return self.__hierarchy
 
-    def is_descendant(self, child_id: str, parent_id: str) -> bool:
-        descendants = self.__ontology.get_descendants(parent_id)
-        descendant_ids : set[str] = {t.go_id for t in descendants}
-        return child_id in descendant_ids
+    def _term_edges(self, term: Term) -> list[tuple[str, str]]:
+        # (relation, parent) pairs of one term, only towards terms we actually have
+        terms = self.__ontology.terms
+        edges = [("is_a", parent.go_id) for parent in term.parents]
+        for rel, target in term.relationships:
+            if rel in self.relations and target in terms:
+                edges.append((rel, target))
+        return edges
 
-    def is_ancestor(self, parent_id: str, child_id: str) -> bool:
-        ancestors = self.__ontology.get_ancestors(child_id)
-        ancestor_ids : set[str] = {t.go_id for t in ancestors}
-        return parent_id in ancestor_ids
+    def _edges(self) -> dict[str, list[tuple[str, str]]]:
+        # (child, parent) pairs per relation
+        edges = {rel: [] for rel in self.relations}
+        for term in self.__ontology.terms.values():
+            for rel, parent in self._term_edges(term):
+                edges[rel].append((term.go_id, parent))
+        return edges
+
+    def build_closure(self) -> None:
+        # terms are numbered in topological order over every typed edge (parents before
+        # children), so a term's ancestors always sit at lower positions than the term
+        self.__index = {}
+        self.__ids = []
+        self.__anc_bits = {}
+        self.__desc_bits = {}
+        self.__subgraphs.clear()
+
+        edges = self._edges()
+        children_of : dict[str, list[str]] = {}
+        pending = {go_id: 0 for go_id in self.__ontology.terms}
+        for pairs in edges.values():
+            for child, parent in pairs:
+                children_of.setdefault(parent, []).append(child)
+                pending[child] += 1
+
+        queue = [go_id for go_id, n in pending.items() if n == 0]
+        while queue:
+            go_id = queue.pop()
+            self.__index[go_id] = len(self.__ids)
+            self.__ids.append(go_id)
+            for child in children_of.get(go_id, []):
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+
+        n = len(self.__ids)
+        for rel, pairs in edges.items():
+            child_pos = np.array([self.__index[c] for c, _ in pairs], dtype=np.int32)
+            parent_pos = np.array([self.__index[p] for _, p in pairs], dtype=np.int32)
+            self.__parents_adj[rel] = self._csr(child_pos, parent_pos, n)
+            self.__children_adj[rel] = self._csr(parent_pos, child_pos, n)
+
+        # closure for the common relation set and depths, walked once in topological order
+        closure = []
+        self.__depth = np.zeros(n, dtype=np.int32)
+        for idx in range(n):
+            parents = self._neighbours(self.__parents_adj, self.default_relations, idx)
+            parts = [parents] + [closure[p] for p in parents]
+            closure.append(np.unique(np.concatenate(parts)) if len(parents) else parents)
+            all_parents = self._neighbours(self.__parents_adj, self.relations, idx)
+            if len(all_parents):
+                self.__depth[idx] = self.__depth[all_parents].max() + 1
+        lengths = np.array([len(c) for c in closure], dtype=np.int64)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        indices = np.concatenate(closure).astype(np.int32) if n else np.empty(0, dtype=np.int32)
+        self.__default_anc = (indptr, indices)
+
+    def update_terms(self, changed_ids, removed_ids) -> tuple[set[str], set[str]]:
+        # call after TermCollection.replace_terms(). Only the changed terms' edges are
+        # replaced, and closure / depth are recomputed for their descendants alone. Untouched
+        # terms keep their positions (new terms are appended, removed ones leave a gap), so
+        # bitsets held elsewhere stay valid. Positions may stop being topological after
+        # this, ordering code uses the depths instead. Returns the terms whose ancestors and
+        # the terms whose descendants may have changed.
+        if not self.__index:
+            self.build_closure()
+            return set(self.__index), set(self.__index)
+
+        terms = self.__ontology.terms
+        changed = [g for g in dict.fromkeys(changed_ids) if g in terms]
+        self.check_update([terms[g] for g in changed], removed_ids)
+        removed = [self.__index[g] for g in removed_ids if g in self.__index and g not in terms]
+        touched = [self.__index[g] for g in changed if g in self.__index] + removed
+
+        # old neighbourhood, read before the adjacency is replaced
+        below = self._reach(self.__children_adj, touched)
+        above = self._reach(self.__parents_adj, touched)
+        old_is_a = {idx: self._neighbours(self.__parents_adj, ("is_a",), idx).tolist() for idx in touched}
+
+        for go_id in changed:
+            if go_id not in self.__index:
+                self.__index[go_id] = len(self.__ids)
+                self.__ids.append(go_id)
+        for idx in removed:
+            del self.__index[self.__ids[idx]]
+        n = len(self.__ids)
+        touched_arr = np.array(touched + [self.__index[g] for g in changed], dtype=np.int32)
+        removed_arr = np.array(removed, dtype=np.int32)
+
+        # adjacency: drop every edge out of a touched term (or into a removed one), add the new ones
+        new_edges = {rel: [] for rel in self.relations}
+        for go_id in changed:
+            for rel, parent in self._term_edges(terms[go_id]):
+                new_edges[rel].append((self.__index[go_id], self.__index[parent]))
+        for rel in self.relations:
+            src, dst = self._pairs(self.__parents_adj[rel])
+            keep = ~np.isin(src, touched_arr) & ~np.isin(dst, removed_arr)
+            pairs = np.array(new_edges[rel], dtype=np.int32).reshape(-1, 2)
+            src = np.concatenate([src[keep], pairs[:, 0]]).astype(np.int32)
+            dst = np.concatenate([dst[keep], pairs[:, 1]]).astype(np.int32)
+            self.__parents_adj[rel] = self._csr(src, dst, n)
+            self.__children_adj[rel] = self._csr(dst, src, n)
+
+        # new neighbourhood
+        starts = [self.__index[g] for g in changed]
+        below |= self._reach(self.__children_adj, starts) | set(starts)
+        above |= self._reach(self.__parents_adj, starts)
+        below -= set(removed)
+        above -= set(removed)
+
+        for cache in self.__anc_bits.values():
+            for idx in below | set(removed):
+                cache.pop(idx, None)
+        for cache in self.__desc_bits.values():
+            for idx in above | set(removed) | set(touched):
+                cache.pop(idx, None)
+        self.__subgraphs.clear()
+
+        # closure and depth of the affected terms, parents first
+        order = self._topological(below)
+        indptr, indices = self.__default_anc
+        depth = np.zeros(n, dtype=np.int32)
+        depth[:len(self.__depth)] = self.__depth
+        closure = {}
+        for idx in order:
+            parents = self._neighbours(self.__parents_adj, self.default_relations, idx)
+            parts = [parents] + [closure[p] if p in closure else indices[indptr[p]:indptr[p + 1]] for p in parents.tolist()]
+            closure[idx] = np.unique(np.concatenate(parts)) if len(parents) else parents
+            all_parents = self._neighbours(self.__parents_adj, self.relations, idx)
+            depth[idx] = depth[all_parents].max() + 1 if len(all_parents) else 0
+        self.__depth = depth
+
+        rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+        keep = ~np.isin(rows, np.array(sorted(below) + removed, dtype=np.int32))
+        new_rows = [np.full(len(c), idx, dtype=np.int32) for idx, c in closure.items()]
+        src = np.concatenate([rows[keep]] + new_rows).astype(np.int32)
+        dst = np.concatenate([indices[keep]] + [c for c in closure.values()]).astype(np.int32)
+        self.__default_anc = self._csr(src, dst, n)
+
+        # is_a children map from build_tree()
+        if self.__hierarchy:
+            for idx, parents in old_is_a.items():
+                for p in parents:
+                    self.__hierarchy.get(self.__ids[p], set()).discard(self.__ids[idx])
+            for idx in removed:
+                self.__hierarchy.pop(self.__ids[idx], None)
+            for go_id in changed:
+                self.__hierarchy.setdefault(go_id, set())
+                for parent in terms[go_id].parents:
+                    self.__hierarchy.setdefault(parent.go_id, set()).add(go_id)
+
+        return {self.__ids[idx] for idx in below}, {self.__ids[idx] for idx in above}
+
+    def check_update(self, new_terms, removed_ids) -> None:
+        # raises ValueError if swapping new_terms in (and dropping removed_ids) would create a
+        # cycle, without touching anything. Works before or after TermCollection.replace_terms():
+        # edges come from the new terms' own is_a / relationships and from the current adjacency
+        # for every other term, the same edges update_terms() ends up with
+        terms = self.__ontology.terms
+        new = {t.go_id: t for t in new_terms}
+        removed = set(removed_ids) - new.keys()
+
+        def parents(go_id: str) -> list[str]:
+            term = new.get(go_id)
+            if term is not None:
+                targets = list(term.is_a) + [t for rel, t in term.relationships if rel in self.relations]
+                return [p for p in targets if p not in removed and (p in new or p in terms)]
+            idx = self.__index.get(go_id)
+            if idx is None:
+                return []
+            found = (self.__ids[p] for p in self._neighbours(self.__parents_adj, self.relations, idx).tolist())
+            return [p for p in found if p not in removed]
+
+        # the old graph is acyclic, so a cycle has to run through a new term: depth-first
+        # from each of them, a parent still on the current path closes one
+        state = {}   # go_id -> 1 on the current path, 2 done
+        for start in new:
+            if start in state:
+                continue
+            state[start] = 1
+            stack = [(start, iter(parents(start)))]
+            while stack:
+                go_id, pending = stack[-1]
+                parent = next(pending, None)
+                if parent is None:
+                    state[go_id] = 2
+                    stack.pop()
+                elif state.get(parent) == 1:
+                    raise ValueError(f"The updated ontology contains a cycle through {parent}")
+                elif parent not in state:
+                    state[parent] = 1
+                    stack.append((parent, iter(parents(parent))))
+
+    def _reach(self, adjacency: dict, starts) -> set[int]:
+        # every position reachable from starts over all relations (starts excluded)
+        seen = set()
+        stack = list(starts)
+        while stack:
+            for nxt in self._neighbours(adjacency, self.relations, stack.pop()).tolist():
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def _topological(self, positions: set[int]) -> list[int]:
+        # Kahn's order over a subset, parents outside it are treated as done
+        pending = {}
+        for idx in positions:
+            parents = self._neighbours(self.__parents_adj, self.relations, idx).tolist()
+            pending[idx] = sum(1 for p in parents if p in positions)
+        queue = [idx for idx, count in pending.items() if count == 0]
+        order = []
+        while queue:
+            idx = queue.pop()
+            order.append(idx)
+            for c in self._neighbours(self.__children_adj, self.relations, idx).tolist():
+                if c in pending:
+                    pending[c] -= 1
+                    if pending[c] == 0:
+                        queue.append(c)
+        if len(order) != len(positions):
+            raise ValueError("The updated ontology contains a cycle")
+        return order
+
+    @staticmethod
+    def _pairs(csr: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        indptr, indices = csr
+        return np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr)), indices
+
+    @staticmethod
+    def _csr(src: np.ndarray, dst: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return indptr, dst[order]
+
+    @staticmethod
+    def _neighbours(adjacency: dict, relations, idx: int) -> np.ndarray:
+        found = []
+        for rel in relations:
+            indptr, indices = adjacency[rel]
+            found.append(indices[indptr[idx]:indptr[idx + 1]])
+        return np.concatenate(found) if len(found) > 1 else found[0]
+
+    def _relations(self, relations) -> tuple[str, ...]:
+        if relations is None:
+            return self.default_relations
+        if isinstance(relations, str) or not relations or any(rel not in self.relations for rel in relations):
+            raise ValueError(f"Relations must be a non-empty subset of {self.relations}")
+        return tuple(rel for rel in self.relations if rel in relations)
+
+    def term_index(self, go_id: str) -> int | None:
+        if not self.__index:
+            self.build_closure()
+        return self.__index.get(go_id)
 
-    def is_related(self, go_id1: str , go_id2: str) -> bool:
-        return (self.is_ancestor(go_id1,go_id2) or
-                self.is_descendant(go_id1,go_id2))
+    def parent_ids(self, go_id: str, relations=None) -> list[str]:
+        idx = self.term_index(go_id)
+        if idx is None:
+            return []
+        return [self.__ids[p] for p in self._neighbours(self.__parents_adj, self._relations(relations), idx)]
+
+    def child_ids(self, go_id: str, relations=None) -> list[str]:
+        idx = self.term_index(go_id)
+        if idx is None:
+            return []
+        return [self.__ids[c] for c in self._neighbours(self.__children_adj, self._relations(relations), idx)]
+
+    def ancestor_bits(self, go_id: str, relations=None) -> int:
+        idx = self.term_index(go_id)
+        return 0 if idx is None else self.__ancestor_bits(idx, self._relations(relations))
+
+    def descendant_bits(self, go_id: str, relations=None) -> int:
+        idx = self.term_index(go_id)
+        return 0 if idx is None else self.__descendant_bits(idx, self._relations(relations))
+
+    def term_depth(self, go_id: str) -> int | None:
+        # longest chain of typed edges up to a root
+        idx = self.term_index(go_id)
+        return None if idx is None else int(self.__depth[idx])
+
+    def get_ancestors(self, go_id: str, relations=None) -> set[str]:
+        return set(self.bits_to_terms(self.ancestor_bits(go_id, relations)))
+
+    def get_descendants(self, go_id: str, relations=None) -> set[str]:
+        return set(self.bits_to_terms(self.descendant_bits(go_id, relations)))
+
+    def __ancestor_bits(self, idx: int, relations: tuple[str, ...]) -> int:
+        cache = self.__anc_bits.setdefault(frozenset(relations), {})
+        bits = cache.get(idx)
+        if bits is None:
+            if relations == self.default_relations:
+                indptr, indices = self.__default_anc
+                bits = self._to_bits(indices[indptr[idx]:indptr[idx + 1]])
+            else:
+                bits = 0
+                for p in self._neighbours(self.__parents_adj, relations, idx).tolist():
+                    bits |= self.__ancestor_bits(p, relations) | (1 << p)
+            cache[idx] = bits
+        return bits
+
+    def __descendant_bits(self, idx: int, relations: tuple[str, ...]) -> int:
+        cache = self.__desc_bits.setdefault(frozenset(relations), {})
+        bits = cache.get(idx)
+        if bits is None:
+            bits = 0
+            for c in self._neighbours(self.__children_adj, relations, idx).tolist():
+                bits |= self.__descendant_bits(c, relations) | (1 << c)
+            cache[idx] = bits
+        return bits
+
+    @staticmethod
+    def _to_bits(positions: np.ndarray) -> int:
+        if not len(positions):
+            return 0
+        mask = np.zeros(int(positions.max()) + 1, dtype=bool)
+        mask[positions] = True
+        return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+    def terms_to_bits(self, go_ids) -> int:
+        bits = 0
+        for go_id in go_ids:
+            idx = self.term_index(go_id)
+            if idx is not None:
+                bits |= 1 << idx
+        return bits
+
+    def bits_to_terms(self, bits: int) -> list[str]:
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(self.__ids[low.bit_length() - 1])
+            bits ^= low
+        return out
 
+    def is_descendant(self, child_id: str, parent_id: str, relations=None) -> bool:
+        idx = self.term_index(child_id)
+        return idx is not None and bool(self.descendant_bits(parent_id, relations) >> idx & 1)
 
-    def pedigree_paths (self, parent_id: str, child_id: str, visited=None) :
+    def is_ancestor(self, parent_id: str, child_id: str, relations=None) -> bool:
+        idx = self.term_index(parent_id)
+        return idx is not None and bool(self.ancestor_bits(child_id, relations) >> idx & 1)
+
+    def is_related(self, go_id1: str , go_id2: str, relations=None) -> bool:
+        return (self.is_ancestor(go_id1,go_id2,relations) or
+                self.is_descendant(go_id1,go_id2,relations))
+
+
+    def pedigree_paths (self, parent_id: str, child_id: str, visited=None, relations=None, progress=None) :
         if visited is None:
             visited = set()
 
@@ -46,38 +412,117 @@ class OntologyHierarchy:
         
         paths=[]
 
-        for child in self.__hierarchy.get(parent_id, set()):
-            subpaths = self.pedigree_paths(child, child_id, visited.copy())
-            for sp in subpaths:
-                paths.append([parent_id] + sp)
+        # only walk into children that can still reach child_id
+        target = self.ancestor_bits(child_id, relations) | self.terms_to_bits([child_id])
+        children = self.child_ids(parent_id, relations)
+        for done, child in enumerate(children, 1):
+            if target >> self.__index[child] & 1:
+                subpaths = self.pedigree_paths(child, child_id, visited.copy(), relations)
+                for sp in subpaths:
+                    paths.append([parent_id] + sp)
+            if progress is not None:   # top-level call only, e.g. from a background job
+                progress(done, len(children))
         return paths
 
-    def shortest_path(self, parent_id: str, child_id: str)  -> list[str] | None:
-        paths = self.pedigree_paths(parent_id, child_id)
+    def shortest_path(self, parent_id: str, child_id: str, relations=None)  -> list[str] | None:
+        paths = self.pedigree_paths(parent_id, child_id, relations=relations)
         return min(paths, key=len) if paths else None
 
 
-    def longest_path(self, parent_id: str, child_id: str)  -> list[str] | None:
-        paths = self.pedigree_paths(parent_id, child_id)
+    def longest_path(self, parent_id: str, child_id: str, relations=None)  -> list[str] | None:
+        paths = self.pedigree_paths(parent_id, child_id, relations=relations)
         return max(paths, key=len) if paths else None
 
 
-    def MSCA(self, go_id1: str, go_id2: str) -> str | None: #Most Specific Common Ancestor
-        ancestors1 = self.__ontology.get_ancestors(go_id1)
-        ancestors2 = self.__ontology.get_ancestors(go_id2)
-        
-        common = ancestors1.intersection(ancestors2)
+    def MSCA(self, go_id1: str, go_id2: str, relations=None) -> str | None: #Most Specific Common Ancestor
+        common = self.ancestor_bits(go_id1, relations) & self.ancestor_bits(go_id2, relations)
 
         if not common:
             return None
-        
-        def depth(term):
-            paths = self.pedigree_paths(term.go_id, go_id1)
-            return max(len(p) for p in paths) if paths else 0
 
-        return max(common, key=depth).go_id
+        # longest path (in edges) from each ancestor down to go_id1; walking the cone deepest
+        # first (a child is always deeper than its parents) means every term is final before
+        # its parents see it
+        relations = self._relations(relations)
+        start = self.term_index(go_id1)
+        depth = {start: 0}
+        cone = self.bits_to_terms(self.ancestor_bits(go_id1, relations) | (1 << start))
+        for go_id in sorted(cone, key=lambda g: -self.__depth[self.__index[g]]):
+            idx = self.__index[go_id]
+            for p in self._neighbours(self.__parents_adj, relations, idx).tolist():
+                depth[p] = max(depth.get(p, 0), depth[idx] + 1)
+
+        best = max((depth[self.__index[go_id]], -self.__index[go_id], go_id) for go_id in self.bits_to_terms(common))
+        return best[2]
       
 
+    def subgraph(self, go_ids, relations=None, up: bool = True, down: bool = False) -> dict:
+        # induced sub-DAG of the given terms plus their ancestors (up) and/or descendants (down)
+        return self.subgraph_from_bits(self.terms_to_bits(go_ids), relations, up, down)
+
+    def subgraph_from_bits(self, seeds: int, relations=None, up: bool = True, down: bool = False) -> dict:
+        # the result is cached and shared between callers, treat it as read-only
+        relations = self._relations(relations)
+        key = (seeds, relations, up, down)
+        cached = self.__subgraphs.get(key)
+        if cached is not None:
+            self.__subgraphs.move_to_end(key)
+            return cached
+
+        nodes = seeds
+        for go_id in self.bits_to_terms(seeds):
+            idx = self.__index[go_id]
+            if up:
+                nodes |= self.__ancestor_bits(idx, relations)
+            if down:
+                nodes |= self.__descendant_bits(idx, relations)
+
+        # single pass over the node set: keep every typed edge whose parent is also inside
+        node_ids = self.bits_to_terms(nodes)
+        edges = []
+        for go_id in node_ids:
+            idx = self.__index[go_id]
+            for rel in relations:
+                indptr, indices = self.__parents_adj[rel]
+                for p in indices[indptr[idx]:indptr[idx + 1]].tolist():
+                    if nodes >> p & 1:
+                        edges.append([go_id, self.__ids[p], rel])
+
+        terms = self.__ontology.terms
+        result = {
+            "nodes": [{"id": go_id,
+                       "name": terms[go_id].name,
+                       "namespace": terms[go_id].namespace,
+                       "seed": bool(seeds >> self.__index[go_id] & 1)} for go_id in node_ids],
+            "edges": edges
+        }
+        self.__subgraphs[key] = result
+        if len(self.__subgraphs) > self.subgraph_cache_size:
+            self.__subgraphs.popitem(last=False)
+        return result
+
+    @classmethod
+    def export_subgraph(cls, subgraph: dict, fmt: str = "json") -> str:
+        if fmt not in cls.subgraph_formats:
+            raise ValueError(f"Format must be one of {cls.subgraph_formats}")
+        if fmt == "json":
+            return json.dumps(subgraph, separators=(",", ":"))
+        if fmt == "edges":
+            # child <tab> parent <tab> relation, one edge per line
+            return "".join(f"{child}\t{parent}\t{rel}\n" for child, parent, rel in subgraph["edges"])
+
+        # DOT with edges pointing child -> parent, seed terms highlighted
+        lines = ["digraph GO {", "  rankdir=BT;", "  node [shape=box];"]
+        for node in subgraph["nodes"]:
+            label = f"{node['id']}\\n{node['name']}".replace('"', '\\"')
+            style = ", style=filled, fillcolor=lightblue" if node["seed"] else ""
+            lines.append(f'  "{node["id"]}" [label="{label}"{style}];')
+        for child, parent, rel in subgraph["edges"]:
+            style = "" if rel == "is_a" else f' [label="{rel}", style=dashed]'
+            lines.append(f'  "{child}" -> "{parent}"{style};')
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
     def __repr__(self):
         text =''
         for parent in self.__hierarchy:
@@ -0,0 +1,121 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class Job:
+    def __init__(self, job_id: str, name: str, args: tuple) -> None:
+        self.id = job_id
+        self.name = name
+        self.args = args
+        self.status = "queued"     # queued -> running -> done | failed
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def report(self, done: int, total: int | None = None) -> None:
+        # progress callback handed to the job function (thread pool only)
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "args": list(self.args),
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class JobQueue:
+    # local scheduler for slow analyses: a bounded pool, identical in-flight jobs share one Job,
+    # and finished jobs are kept (up to keep_finished) so their result can be fetched later
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 50,
+                 keep_finished: int = 200, executor: str = "thread") -> None:
+        if executor not in ("thread", "process"):
+            raise ValueError("executor must be 'thread' or 'process'")
+        self.__executor_kind = executor
+        self.__pool = (ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor)(max_workers=max_workers)
+        self.__max_pending = max_pending
+        self.__keep_finished = keep_finished
+        self.__lock = threading.Lock()
+        self.__ids = itertools.count(1)
+        self.__jobs: OrderedDict[str, Job] = OrderedDict()
+        self.__in_flight: dict[tuple, Job] = {}
+
+    def submit(self, name: str, fn, *args) -> Job:
+        # thread jobs get the Job's progress callback as keyword `progress`;
+        # process jobs must be picklable and only report status
+        key = (name, args)
+        with self.__lock:
+            job = self.__in_flight.get(key)
+            if job is not None:
+                return job
+            if len(self.__in_flight) >= self.__max_pending:
+                raise JobQueueFull(f"{len(self.__in_flight)} jobs already queued or running")
+
+            job = Job(f"{name}-{next(self.__ids)}", name, args)
+            self.__jobs[job.id] = job
+            self.__in_flight[key] = job
+
+        if self.__executor_kind == "thread":
+            self.__pool.submit(self._run, job, fn, args)
+        else:
+            job.status, job.started = "running", time.time()
+            future = self.__pool.submit(fn, *args)
+
+            def done(f) -> None:
+                error = f.exception()
+                self._finish(job, None if error else f.result(), error)
+            future.add_done_callback(done)
+        return job
+
+    def _run(self, job: Job, fn, args: tuple) -> None:
+        job.status, job.started = "running", time.time()
+        try:
+            result = fn(*args, progress=job.report)
+        except Exception as e:
+            self._finish(job, None, e)
+        else:
+            self._finish(job, result, None)
+
+    def _finish(self, job: Job, result, error: BaseException | None) -> None:
+        with self.__lock:
+            job.result = result
+            job.error = f"{type(error).__name__}: {error}" if error else None
+            job.status = "failed" if error else "done"
+            job.finished = time.time()
+            self.__in_flight.pop((job.name, job.args), None)
+
+            # forget the oldest finished jobs beyond the retention limit
+            finished = [j for j in self.__jobs.values() if j.finished is not None]
+            for old in finished[:max(len(finished) - self.__keep_finished, 0)]:
+                del self.__jobs[old.id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def jobs(self) -> list[Job]:
+        with self.__lock:
+            return list(self.__jobs.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.__pool.shutdown(wait=wait)
@@ -0,0 +1,138 @@
+import os
+
+from parsers import OBOParser, GAFParser
+from ontology import Term, TermCollection
+from annotations import GeneAnnotation, AnnotationCollection
+from annotation_store import AnnotationStore
+from hierarchy import OntologyHierarchy
+from analysis import *
+from filters import AnnotationMasks, POSITIVE
+from search import SearchIndex
+from releasediff import ReleaseDiff
+
+
+# builds the whole in-memory snapshot (ontology, annotations, analysers) used by the
+# web app and by the batch runner. With store_dir the annotations are served from a
+# memory-mapped AnnotationStore (built there on first use) instead of GeneAnnotation objects,
+# and the GAF is never parsed into a DataFrame: masks, summary and similarity read the store
+def load_data(obo_path: str = "gene ontology.txt", gaf_path: str = "gaf.txt", matrix_dir: str | None = None,
+              store_dir: str | None = None) -> dict:
+    # parse the files
+    print('parsing start')
+    obo_df = OBOParser(obo_path).parse()
+    gaf_df = None if store_dir else GAFParser(gaf_path).parse()
+    print('parsing done')
+
+    # build ontology
+    terms = TermCollection()
+
+    for _, row in obo_df.iterrows():
+        term = Term(
+            go_id=row["go_id"],
+            name=row["name"],
+            namespace=row["namespace"],
+            is_a=row["parents"],
+            definition=row["definition"],
+            synonyms=row["synonyms"],
+            relationships=row["relationships"]
+        )
+        terms.add_term(term)
+
+    print('term relationship is being made')
+    terms.build_vertical_relationship()
+    print('term relationship made')
+
+    # build annotations
+    print('annotation starts')
+    if store_dir:
+        annotations = open_store(store_dir, gaf_path)
+    else:
+        annotations = AnnotationCollection()
+
+        for _, row in gaf_df.iterrows():
+            ann = GeneAnnotation(
+                gene_id=row["gene_id"],
+                gene_name=row["gene_name"],
+                go_id=row["go_id"],
+                aspect=row["aspect"],
+                evidence=row["evidence"],
+                qualifier=row['qualifier'],
+                molecule=row["molecule"],
+                taxon=row["taxon"]
+            )
+            annotations.add_annotation(ann)
+
+    print('annotation made')
+
+    print('linking on process')
+    annotations.link_terms(terms)
+    print('links made')
+
+    # build hierarchy
+    print('building hierarchy')
+    hierarchy = OntologyHierarchy(terms)
+    hierarchy.build_tree()
+    hierarchy.build_closure()
+    print('hierarchy tree done')
+
+    # row masks for evidence / qualifier / aspect / taxon views
+    masks = AnnotationMasks.from_store(annotations) if store_dir else AnnotationMasks(gaf_df)
+    positive = masks.select(POSITIVE)   # NOT annotations don't count as evidence of relatedness
+
+    # build analysers
+    print('start analysing')
+    gene_analyser = GeneAnalyser(annotations, terms, hierarchy, mask=positive)
+    print('finish analysing')
+
+    #stat
+    print('start summary')
+    rows = annotations if store_dir else gaf_df
+    summary_statistics = SummaryStatistics(obo_df, rows, terms)
+    summary= summary_statistics.compute
+    print('finish summary')
+
+    #similarity analysis
+    print('similaity start')
+    similarity_analyser=GeneSimilarityAnalysis(obo_df,rows,hierarchy,mask=positive)
+    # precomputed on-disk matrix (python simmatrix.py DIR), shared by all workers; one built
+    # from other annotations is skipped and similarities are computed exactly instead
+    if matrix_dir and os.path.exists(os.path.join(matrix_dir, 'meta.json')):
+        try:
+            similarity_analyser.attach_matrix(BlockedSimilarityMatrix(matrix_dir))
+        except ValueError as e:
+            print(f'{matrix_dir} not used: {e}')
+    print('similarity finish')
+
+    # prefix / fuzzy lookup over GO IDs, names, synonyms and gene symbols
+    gene_names = annotations.values("gene_name") if store_dir else gaf_df["gene_name"].unique()
+    search_index = SearchIndex(terms, gene_names)
+
+    # per-term fingerprints of the loaded release, what OntologyUpdater diffs new releases against
+    release_index = ReleaseDiff.index_terms(obo_df.to_dict("records"))
+
+    # return structured data
+    return {
+        "release_index": release_index,
+        "ontology_df": obo_df,
+        "annotation_df": gaf_df,
+        "term_collection": terms,
+        'annotations': annotations,
+        'hierarchy': hierarchy,
+        'masks': masks,
+        "gene_analyser": gene_analyser,
+        "summary": summary,
+        "summary_statistics": summary_statistics,
+        'similarity_analyser':similarity_analyser,
+        'search_index': search_index}
+
+
+def open_store(store_dir: str, gaf_path: str) -> AnnotationStore:
+    # rebuilt when missing, from an older layout, or built from a GAF with other contents
+    fingerprint = AnnotationStore.file_fingerprint(gaf_path)
+    try:
+        store = AnnotationStore(store_dir)
+    except (FileNotFoundError, KeyError):
+        store = None
+    if store is None or store.fingerprint != fingerprint:
+        store = AnnotationStore.build(gaf_path, store_dir, fingerprint)
+    return store
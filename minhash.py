@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+
+class MinHashIndex:
+    # approximate jaccard between genes: MinHash signatures + LSH banding
+    # more bands (fewer rows per band) -> more candidates, better recall, slower queries
+    prime = 2147483647   # 2**31 - 1, so a*x + b never overflows int64
+
+    def __init__(self, annotation_df: pd.DataFrame, num_perm: int = 128, bands: int = 32, seed: int = 1) -> None:
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.__num_perm = num_perm
+        self.__bands = bands
+        self.__rows = num_perm // bands
+
+        gene_codes, genes = pd.factorize(annotation_df["gene_name"])
+        term_codes, _ = pd.factorize(annotation_df["go_id"])
+        self.__genes = list(genes)
+        self.__gene_pos = {g: i for i, g in enumerate(self.__genes)}
+
+        # one row per distinct (gene, term), grouped by gene
+        n_terms = int(term_codes.max()) + 1
+        pairs = np.unique(gene_codes.astype(np.int64) * n_terms + term_codes)
+        gene_of = pairs // n_terms
+        term_of = pairs % n_terms
+        starts = np.flatnonzero(np.r_[True, gene_of[1:] != gene_of[:-1]])
+
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, self.prime, num_perm, dtype=np.int64)
+        b = rng.integers(0, self.prime, num_perm, dtype=np.int64)
+
+        self.__sig = np.empty((len(self.__genes), num_perm), dtype=np.uint32)
+        for lo in range(0, num_perm, 16):   # a few permutations at a time keeps memory at rows x 16
+            hashed = (term_of[:, None] * a[None, lo:lo + 16] + b[None, lo:lo + 16]) % self.prime
+            self.__sig[:, lo:lo + 16] = np.minimum.reduceat(hashed, starts, axis=0)
+
+        # per band: bucket id of every gene, plus genes sorted by bucket for lookup
+        self.__buckets = []
+        for band in range(bands):
+            chunk = np.ascontiguousarray(self.__sig[:, band * self.__rows:(band + 1) * self.__rows])
+            keys = chunk.view(np.dtype((np.void, chunk.dtype.itemsize * self.__rows))).ravel()
+            _, bucket_of = np.unique(keys, return_inverse=True)
+            order = np.argsort(bucket_of, kind="stable")
+            offsets = np.searchsorted(bucket_of[order], np.arange(bucket_of.max() + 2))
+            self.__buckets.append((bucket_of, order, offsets))
+
+    @property
+    def genes(self) -> list[str]:
+        return self.__genes
+
+    @property
+    def threshold(self) -> float:
+        # similarity at which a pair has ~50% chance of becoming a candidate
+        return (1 / self.__bands) ** (1 / self.__rows)
+
+    @staticmethod
+    def suggest_bands(num_perm: int, threshold: float) -> int:
+        options = [b for b in range(1, num_perm + 1) if num_perm % b == 0]
+        return min(options, key=lambda b: abs((1 / b) ** (b / num_perm) - threshold))
+
+    def estimate(self, gene1: str, gene2: str) -> float:
+        i = self.__gene_pos.get(gene1)
+        j = self.__gene_pos.get(gene2)
+        if i is None or j is None:
+            return 0.0
+        return float(np.mean(self.__sig[i] == self.__sig[j]))
+
+    def candidates(self, gene: str) -> set[str]:
+        i = self.__gene_pos.get(gene)
+        if i is None:
+            return set()
+
+        found = set()
+        for bucket_of, order, offsets in self.__buckets:
+            bucket = bucket_of[i]
+            found.update(order[offsets[bucket]:offsets[bucket + 1]].tolist())
+        found.discard(i)
+        return {self.__genes[j] for j in found}
+
+    def _scored(self, gene: str) -> list[tuple[str, float]]:
+        i = self.__gene_pos.get(gene)
+        if i is None:
+            return []
+        found = self.candidates(gene)
+        if not found:
+            return []
+        pos = np.array([self.__gene_pos[g] for g in found])
+        scores = (self.__sig[pos] == self.__sig[i]).mean(axis=1)
+        return sorted(zip((self.__genes[p] for p in pos), scores.tolist()), key=lambda x: (-x[1], x[0]))
+
+    def query_threshold(self, gene: str, threshold: float) -> list[tuple[str, float]]:
+        return [(g, round(s, 3)) for g, s in self._scored(gene) if s >= threshold]
+
+    def top_k(self, gene: str, k: int = 10) -> list[tuple[str, float]]:
+        return [(g, round(s, 3)) for g, s in self._scored(gene)[:k]]
+
+    def accuracy_report(self, gene2terms: dict[str, set[str]], threshold: float = 0.5,
+                        sample: int = 200, seed: int = 1) -> dict:
+        # compares LSH retrieval and MinHash estimates against exact jaccard on a gene sample
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(self.__genes, size=min(sample, len(self.__genes)), replace=False)
+
+        true_pos = false_pos = false_neg = 0
+        errors = []
+        n_candidates = 0
+        for gene in queries:
+            terms = gene2terms.get(gene, set())
+            exact = {}
+            for other, other_terms in gene2terms.items():
+                if other != gene and terms & other_terms:
+                    exact[other] = len(terms & other_terms) / len(terms | other_terms)
+
+            relevant = {g for g, s in exact.items() if s >= threshold}
+            retrieved = {g for g, _ in self.query_threshold(gene, threshold)}
+            true_pos += len(relevant & retrieved)
+            false_pos += len(retrieved - relevant)
+            false_neg += len(relevant - retrieved)
+
+            found = self.candidates(gene)
+            n_candidates += len(found)
+            errors.extend(abs(self.estimate(gene, g) - exact.get(g, 0.0)) for g in found)
+
+        return {
+            "num_perm": self.__num_perm,
+            "bands": self.__bands,
+            "rows_per_band": self.__rows,
+            "lsh_threshold": round(self.threshold, 3),
+            "queries": len(queries),
+            "recall": true_pos / (true_pos + false_neg) if true_pos + false_neg else 1.0,
+            "precision": true_pos / (true_pos + false_pos) if true_pos + false_pos else 1.0,
+            "mean_abs_error": float(np.mean(errors)) if errors else 0.0,
+            "avg_candidates": n_candidates / len(queries) if len(queries) else 0.0,
+        }
@@ -1,11 +1,13 @@
 class Term: #Represents a single GO term.(nodes)
-    def __init__(self, go_id: str, name: str, namespace: str, is_a: list[str] | None, definition: str, synonyms: list[str] | None = None):
+    def __init__(self, go_id: str, name: str, namespace: str, is_a: list[str] | None, definition: str, synonyms: list[str] | None = None,
+                 relationships: list[tuple[str, str]] | None = None):
         self.__go_id = go_id
         self.__name = name
         self.__namespace = namespace
         self.__is_a = is_a or [] 
         self.__definition = definition
         self.__synonyms = synonyms or []
+        self.__relationships = relationships or []   # (relation, target go_id), e.g. ("part_of", "GO:0005634")
         self.__parents = set()       # Term objects
         self.__children = set()      # Term objects
 
@@ -43,6 +45,10 @@ class Term: #Represents a single GO term.(nodes)
     def is_a(self):
         return self.__is_a
 
+    @property
+    def relationships(self):
+        return self.__relationships
+
 
     def add_parent(self, parent: 'Term'):
         self.__parents.add(parent)
@@ -73,6 +79,34 @@ class TermCollection: #the entire graph
                         term.add_parent(parent)
 
 
+    def replace_terms(self, new_terms: list[Term], removed_ids) -> None:
+        # swaps changed / added terms in and drops removed ones, relinking only their edges
+        orphans = set()
+        for go_id in {t.go_id for t in new_terms} | set(removed_ids):
+            old = self.__terms.pop(go_id, None)
+            if old is None:
+                continue
+            for parent in old.parents:
+                parent.children.discard(old)
+            for child in old.children:
+                child.parents.discard(old)
+                orphans.add(child)
+
+        for term in new_terms:
+            self.__terms[term.go_id] = term
+        for term in new_terms:
+            for parent_id in term.is_a:
+                parent = self.__terms.get(parent_id)
+                if parent != None:
+                    term.add_parent(parent)
+        for child in orphans:
+            if self.__terms.get(child.go_id) is child:   # replaced children were linked above
+                for parent_id in child.is_a:
+                    parent = self.__terms.get(parent_id)
+                    if parent != None and parent not in child.parents:
+                        child.add_parent(parent)
+
+
     def get_term(self, go_id: str) -> Term | None:
             return self.__terms.get(go_id)
 
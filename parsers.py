@@ -12,21 +12,20 @@ class FileParser(ABC):
 
 class OBOParser(FileParser):
 
-    def parse(self):
-        rows = []
+    def iter_terms(self): # streams one dict per [Term] stanza, obsolete ones included (flagged)
         current_term = None
-        obsolete = False
-
 
         with open(self.file_path) as f:
             for line in f:
                 line = line.strip()
 
-                if line == "[Term]":
-                    # save previous term
-                    if current_term and not obsolete:
-                        rows.append(current_term)
+                if line.startswith("["):
+                    # a new stanza ends the previous term; [Typedef] stanzas are skipped
+                    if current_term:
+                        yield current_term
+                    current_term = None
 
+                if line == "[Term]":
                     # start new term (ALWAYS)
                     current_term = {
                         "go_id": "",
@@ -34,9 +33,11 @@ class OBOParser(FileParser):
                         "namespace": "",
                         "parents": [],
                         "definition":"",
-                        "synonyms": []          
+                        "synonyms": [],
+                        "relationships": [],
+                        "obsolete": False,
+                        "replaced_by": []
                     }
-                    obsolete = False #reset
 
 
                 elif current_term is not None:
@@ -54,8 +55,17 @@ class OBOParser(FileParser):
                         parent_id = line.split("is_a:")[1].split()[0]
                         current_term["parents"].append(parent_id)
 
+                    elif line.startswith("relationship:"):
+                        # relationship: part_of GO:0005634 ! nucleus
+                        parts = line.split("relationship:", 1)[1].split()
+                        if len(parts) >= 2:
+                            current_term["relationships"].append((parts[0], parts[1]))
+
                     elif line.startswith("is_obsolete: true"):
-                        obsolete = True
+                        current_term["obsolete"] = True
+
+                    elif line.startswith("replaced_by:"):
+                        current_term["replaced_by"].append(line.split("replaced_by:")[1].strip())
 
                     elif line.startswith('def:'): # NEW Strips the OBO syntax around the definition and keeps only the content.
                         value = line.split('def:', 1)[1].strip()
@@ -78,33 +88,63 @@ class OBOParser(FileParser):
                             current_term["synonyms"].append(synonym_text)
 
         # save last term
-        if current_term and not obsolete:
-            rows.append(current_term)
+        if current_term:
+            yield current_term
+
+    def parse(self):
+        rows = []
+        for term in self.iter_terms():
+            if not term.pop("obsolete"):
+                del term["replaced_by"]
+                rows.append(term)
 
         return pd.DataFrame(rows)
 
 
 
 class GAFParser(FileParser):
-
-    def parse(self):
-        rows = []
-
+    columns = ["gene_id", "gene_name", "qualifier", "go_id", "aspect", "evidence", "molecule", "taxon"]
+
+    @staticmethod
+    def parse_line(line: str) -> dict:
+        fields = line.strip().split("\t")
+
+        return {
+            "gene_id": fields[1],
+            "gene_name": fields[2],
+            'qualifier': fields[3],
+            "go_id": fields[4],
+            'aspect': fields [8],
+            "evidence": fields[6],
+            "molecule": fields[11],
+            "taxon": fields[12] if len(fields) > 12 else ""
+        }
+
+    def iter_rows(self): # streams one dict per annotation line, so huge GAFs never sit in memory
         with open(self.file_path) as f:
             for line in f:
                 if line.startswith("!"):
                     continue
+                yield self.parse_line(line)
+
+    def parse(self):
+        return pd.DataFrame(list(self.iter_rows()), columns=self.columns)
 
-                fields = line.strip().split("\t")
 
-                rows.append({
-                    "gene_id": fields[1],
-                    "gene_name": fields[2],
-                    'qualifier': fields[3],
-                    "go_id": fields[4],
-                    'aspect': fields [8],
-                    "evidence": fields[6],
-                    "molecule": fields[11]
-                })
 
-        return pd.DataFrame(rows)
+class GAFDeltaParser(GAFParser):
+    # diff-style GAF delta: every line is "+<gaf line>" (added) or "-<gaf line>" (removed)
+
+    def parse(self):
+        added, removed = [], []
+
+        with open(self.file_path) as f:
+            for line in f:
+                if line.startswith(("+++", "---", "+!", "-!")): # diff headers and GAF comments
+                    continue
+                if line[:1] == "+":
+                    added.append(self.parse_line(line[1:]))
+                elif line[:1] == "-":
+                    removed.append(self.parse_line(line[1:]))
+
+        return pd.DataFrame(added, columns=self.columns), pd.DataFrame(removed, columns=self.columns)
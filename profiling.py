@@ -0,0 +1,115 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+
+from flask import Flask, g, request
+
+# functions whose call counts are pulled out of every profile
+HOT_PRIMITIVES = ("get_ancestors", "get_descendants", "ancestor_bits", "descendant_bits",
+                  "pedigree_paths", "get_by_gene_name", "get_by_term", "MSCA")
+
+
+class RequestProfiler:
+    # opt-in per-request profiling. A request is profiled when it carries the header
+    # (X-Profile: 1), the query flag (?profile=1) or is picked by the sample rate. Each
+    # profile is written to output_dir as <stamp>-<endpoint>.prof (cProfile, open with
+    # pstats/snakeviz) or .txt (sampling mode, needs pyinstrument), plus a .json
+    # summary with timings and hot-primitive call counts. Requests that are not
+    # profiled only pay for a header lookup and one random().
+
+    def __init__(self, app: Flask | None = None, output_dir: str = "profiles", sample_rate: float = 0.0,
+                 header: str = "X-Profile", query_flag: str = "profile", mode: str = "cprofile",
+                 endpoints: tuple[str, ...] | None = None) -> None:
+        if mode not in ("cprofile", "sampling"):
+            raise ValueError("mode must be 'cprofile' or 'sampling'")
+        self._sampler = None
+        if mode == "sampling":
+            try:
+                from pyinstrument import Profiler   # optional dependency, only for sampling mode
+            except ImportError:
+                raise ImportError("Sampling mode needs pyinstrument (pip install pyinstrument)") from None
+            self._sampler = Profiler
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.header = header
+        self.query_flag = query_flag
+        self.mode = mode
+        self.endpoints = endpoints    # None = every endpoint
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        app.before_request(self._start)
+        app.after_request(self._stop)
+
+    def _wanted(self) -> bool:
+        if self.endpoints is not None and request.endpoint not in self.endpoints:
+            return False
+        return (request.headers.get(self.header) == "1"
+                or request.args.get(self.query_flag) == "1"
+                or (self.sample_rate > 0 and random.random() < self.sample_rate))
+
+    def _start(self) -> None:
+        if not self._wanted():
+            return
+        if self.mode == "sampling":
+            profiler = self._sampler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:   # another request in this process is already being profiled
+                return
+        g._profiler = profiler
+        g._profile_started = time.perf_counter()
+
+    def _stop(self, response):
+        # streamed responses (stream_template) render while the body is iterated, after this
+        # hook: the profile is named here but only stopped and written when the body is closed
+        profiler = g.pop("_profiler", None)
+        if profiler is None:
+            return response
+        started = g.pop("_profile_started")
+
+        stamp = time.strftime("%Y%m%d-%H%M%S") + f"-{int(time.time() * 1000) % 1000:03d}"
+        base = os.path.join(self.output_dir, f"{stamp}-{request.endpoint}")
+        summary = {
+            "endpoint": request.endpoint,
+            "path": request.path,
+            "method": request.method,
+            "args": request.args.to_dict(),
+            "status": response.status_code,
+            "profile": base + (".txt" if self.mode == "sampling" else ".prof")
+        }
+        response.headers["X-Profile-File"] = os.path.basename(summary["profile"])
+        response.call_on_close(lambda: self._write(profiler, started, summary))
+        return response
+
+    def _write(self, profiler, started: float, summary: dict) -> None:
+        summary["seconds"] = round(time.perf_counter() - started, 6)
+        if self.mode == "sampling":
+            profiler.stop()
+            with open(summary["profile"], "w") as f:
+                f.write(profiler.output_text())
+        else:
+            profiler.disable()
+            profiler.dump_stats(summary["profile"])
+            summary["calls"] = self.hot_calls(pstats.Stats(profiler))
+
+        with open(os.path.splitext(summary["profile"])[0] + ".json", "w") as f:
+            json.dump(summary, f, indent=2)
+
+    @staticmethod
+    def hot_calls(stats: pstats.Stats) -> dict[str, int]:
+        # total calls (including recursive ones) per hot primitive, summed over classes
+        calls = {name: 0 for name in HOT_PRIMITIVES}
+        for (_, _, func), (_, total_calls, _, _, _) in stats.stats.items():
+            name = func.split(".")[-1]
+            if name in calls:
+                calls[name] += total_calls
+        return calls
@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import json
+import sys
+
+from parsers import OBOParser, GAFParser
+from ontology import Term, TermCollection
+
+
+class ReleaseDiff:
+    # structural diff between two GO releases. Both files are streamed through
+    # OBOParser.iter_terms(); the old side is kept only as a compact per-term record
+    # (fingerprint hash, name, obsolete flag, typed parent edges) and new terms are
+    # matched to it by ID, so unchanged terms cost one hash comparison. `old` can be
+    # a path or the `index` of a previous diff, which describes its new release.
+
+    def __init__(self, old, new_path: str) -> None:
+        self.new_path = new_path
+        self.added: list[str] = []
+        self.obsoleted: list[str] = []
+        self.removed: list[str] = []                          # gone from the file altogether
+        self.renamed: dict[str, tuple[str, str]] = {}
+        self.reparented: dict[str, dict[str, list]] = {}
+        self.modified: list[str] = []                         # definition / synonyms / namespace only
+        self.replaced_by: dict[str, list[str]] = {}
+        self.index: dict[str, tuple] = {}
+        self.__rows: dict[str, dict] = {}                     # new rows of added / changed terms
+
+        old_index = self.build_index(old) if isinstance(old, str) else dict(old)
+        self._compare(old_index)
+
+    @staticmethod
+    def fingerprint(term: dict) -> bytes:
+        content = (term["name"], term["namespace"], term["definition"], sorted(term["synonyms"]),
+                   sorted(ReleaseDiff._edges(term)), term.get("obsolete", False))
+        return hashlib.blake2b(repr(content).encode(), digest_size=16).digest()
+
+    @staticmethod
+    def _edges(term: dict) -> frozenset:
+        return frozenset([("is_a", p) for p in term["parents"]] + [tuple(r) for r in term["relationships"]])
+
+    @classmethod
+    def _record(cls, term: dict) -> tuple:
+        return cls.fingerprint(term), term["name"], term.get("obsolete", False), cls._edges(term)
+
+    @classmethod
+    def build_index(cls, obo_path: str) -> dict[str, tuple]:
+        return cls.index_terms(OBOParser(obo_path).iter_terms())
+
+    @classmethod
+    def index_terms(cls, terms) -> dict[str, tuple]:
+        # also takes OBOParser.parse() rows (obsolete terms already dropped); diffs against it
+        # come out the same, a term missing from the old side counts as new or stays unreported
+        return {term["go_id"]: cls._record(term) for term in terms}
+
+    def _compare(self, old_index: dict[str, tuple]) -> None:
+        for term in OBOParser(self.new_path).iter_terms():
+            go_id = term["go_id"]
+            record = self._record(term)
+            self.index[go_id] = record
+            before = old_index.pop(go_id, None)
+
+            if before is not None and before[0] == record[0]:
+                continue
+            if term["obsolete"]:
+                if before is not None and not before[2]:
+                    self.obsoleted.append(go_id)
+                    self.replaced_by[go_id] = term["replaced_by"]
+                continue
+            self.__rows[go_id] = term
+            if before is None or before[2]:   # new, or brought back from obsolete
+                self.added.append(go_id)
+                continue
+
+            _, old_name, _, old_edges = before
+            if old_name != term["name"]:
+                self.renamed[go_id] = (old_name, term["name"])
+            if old_edges != record[3]:
+                self.reparented[go_id] = {"removed": sorted(old_edges - record[3]),
+                                          "added": sorted(record[3] - old_edges)}
+            if old_name == term["name"] and old_edges == record[3]:
+                self.modified.append(go_id)
+
+        # whatever is left was dropped from the file
+        self.removed = [go_id for go_id, record in old_index.items() if not record[2]]
+
+    @property
+    def changed_ids(self) -> list[str]:
+        # terms to swap in: added, renamed, re-parented or otherwise modified
+        return list(self.__rows)
+
+    @property
+    def gone_ids(self) -> list[str]:
+        return self.obsoleted + self.removed
+
+    def rows(self) -> list[dict]:
+        # OBOParser.parse() style rows of the changed terms
+        return [{k: v for k, v in row.items() if k not in ("obsolete", "replaced_by")} for row in self.__rows.values()]
+
+    def new_terms(self) -> list[Term]:
+        return [Term(go_id=row["go_id"], name=row["name"], namespace=row["namespace"], is_a=row["parents"],
+                     definition=row["definition"], synonyms=row["synonyms"], relationships=row["relationships"])
+                for row in self.rows()]
+
+    def apply(self, term_collection: TermCollection, hierarchy) -> tuple[set[str], set[str]]:
+        # updates an already built collection + OntologyHierarchy in place; returns the terms
+        # whose ancestor / descendant closures changed. A release that would create a cycle
+        # raises ValueError before anything is touched
+        new_terms = self.new_terms()
+        hierarchy.check_update(new_terms, self.gone_ids)
+        term_collection.replace_terms(new_terms, self.gone_ids)
+        return hierarchy.update_terms(self.changed_ids, self.gone_ids)
+
+    def affected_annotations(self, annotations, closure_changed=None) -> dict[str, dict]:
+        # annotations: iterable of (gene_name, go_id) pairs, counted in one pass per category
+        categories = {
+            "obsoleted": set(self.obsoleted),
+            "removed": set(self.removed),
+            "renamed": set(self.renamed),
+            "reparented": set(self.reparented),
+            "closure_changed": set(closure_changed or ())
+        }
+        counts = {name: 0 for name in categories}
+        genes = {name: set() for name in categories}
+        for gene, go_id in annotations:
+            for name, go_ids in categories.items():
+                if go_id in go_ids:
+                    counts[name] += 1
+                    genes[name].add(gene)
+        return {name: {"terms": len(categories[name]), "annotations": counts[name], "genes": sorted(genes[name])}
+                for name in categories}
+
+    def to_dict(self) -> dict:
+        return {
+            "added": self.added,
+            "obsoleted": [{"go_id": g, "replaced_by": self.replaced_by.get(g, [])} for g in self.obsoleted],
+            "removed": self.removed,
+            "renamed": [{"go_id": g, "old": old, "new": new} for g, (old, new) in self.renamed.items()],
+            "reparented": [{"go_id": g,
+                            "removed": [list(e) for e in edges["removed"]],
+                            "added": [list(e) for e in edges["added"]]} for g, edges in self.reparented.items()],
+            "modified": self.modified,
+            "counts": {
+                "added": len(self.added),
+                "obsoleted": len(self.obsoleted),
+                "removed": len(self.removed),
+                "renamed": len(self.renamed),
+                "reparented": len(self.reparented),
+                "modified": len(self.modified)
+            }
+        }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Diff two GO releases (OBO files).")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--gaf", help="also count the annotations on changed terms")
+    args = parser.parse_args(argv)
+
+    diff = ReleaseDiff(args.old, args.new)
+    report = diff.to_dict()
+    if args.gaf:
+        rows = ((row["gene_name"], row["go_id"]) for row in GAFParser(args.gaf).iter_rows())
+        report["annotations"] = diff.affected_annotations(rows)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+from ontology import TermCollection
+
+
+class SearchIndex:
+    # in-memory lookup over GO IDs, term names, synonyms and gene symbols.
+    # Prefix matches come from two sorted arrays of normalised keys searched with bisect:
+    # whole labels, and every later word start of every label (so "kinase" finds "protein
+    # kinase activity"), kept per kind so a kind filter never walks the other kind's keys.
+    # Typos fall back to a trigram inverted index over the word vocabulary: each query
+    # word is matched to similar vocabulary words by Dice overlap (retried at
+    # fallback_score when nothing reaches min_score), and a label matches when every
+    # query word matches one of its words.
+    kinds = ("term", "gene")
+    field_rank = {"id": 0, "name": 1, "symbol": 1, "synonym": 2}
+    # left out of fuzzy queries that have other words: they match a large part of the labels
+    stop_words = frozenset({"a", "an", "and", "as", "at", "by", "for", "from", "in", "into", "of", "on", "or",
+                            "the", "to", "via", "with"})
+
+    def __init__(self, term_collection: TermCollection, gene_names=(), min_score: float = 0.4,
+                 fallback_score: float = 0.3) -> None:
+        self.__min_score = min_score
+        self.__fallback_score = fallback_score
+        # one entry per searchable label: (kind, id, field, label) and its normalised form
+        self.__entries: list[tuple[str, str, str, str]] = []
+        self.__normalised: list[str] = []
+        self.__entry_words: list[tuple[int, ...]] = []
+        self.__seen: set[tuple[str, str, str]] = set()
+        self.__names: dict[tuple[str, str], str] = {}   # display name per hit
+        self.__item_entries: dict[tuple[str, str], list[int]] = defaultdict(list)
+        self.__dead: set[int] = set()   # entries of removed / replaced terms
+        # sorted prefix keys per (kind, "label" / "word"): whole labels and word starts, each
+        # with the entry it points at
+        self.__keys: dict[tuple[str, str], list[str]] = {(kind, position): [] for kind in self.kinds
+                                                         for position in ("label", "word")}
+        self.__key_entries: dict[tuple[str, str], list[int]] = {key: [] for key in self.__keys}
+        # position of every entry in (field rank, label length, id) order, how fuzzy() breaks score
+        # ties, and the first position of each field rank after the first
+        self.__entry_rank: list[int] = []
+        self.__field_starts: list[int] = []
+        self.__sorted = False
+        # word vocabulary: word -> id, postings (entries using it) and trigram -> word ids
+        self.__words: dict[str, int] = {}
+        self.__word_list: list[str] = []
+        self.__word_entries: list[list[int]] = []
+        self.__grams: dict[str, list[int]] = defaultdict(list)
+
+        self.add_terms(term_collection.terms.values())
+        self.add_genes(gene_names)
+        self._sort()
+
+    @staticmethod
+    def normalise(text: str) -> str:
+        return " ".join(re.split(r"[\s_\-,/()]+", text.lower())).strip()
+
+    @staticmethod
+    def trigrams(text: str) -> set[str]:
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _word(self, word: str) -> int:
+        word_id = self.__words.get(word)
+        if word_id is None:
+            word_id = self.__words[word] = len(self.__word_list)
+            self.__word_list.append(word)
+            self.__word_entries.append([])
+            for gram in self.trigrams(word):
+                self.__grams[gram].append(word_id)
+        return word_id
+
+    def _add(self, kind: str, item_id: str, field: str, label: str) -> None:
+        if (kind, item_id, label) in self.__seen:
+            return
+        self.__seen.add((kind, item_id, label))
+        entry = len(self.__entries)
+        key = self.normalise(label)
+        self.__entries.append((kind, item_id, field, label))
+        self.__normalised.append(key)
+        self.__item_entries[(kind, item_id)].append(entry)
+
+        # a prefix key for every word start, all pointing at the same entry
+        words = key.split(" ")
+        start = 0
+        for word in words:
+            position = "word" if start else "label"
+            self.__keys[(kind, position)].append(key[start:])
+            self.__key_entries[(kind, position)].append(entry)
+            start += len(word) + 1
+        word_ids = tuple(dict.fromkeys(self._word(w) for w in words if w))
+        for word_id in word_ids:
+            self.__word_entries[word_id].append(entry)
+        self.__entry_words.append(word_ids)
+        self.__sorted = False
+
+    def add_terms(self, terms) -> None:
+        for term in terms:
+            self.__names[("term", term.go_id)] = term.name
+            self._add("term", term.go_id, "id", term.go_id)
+            if term.name:
+                self._add("term", term.go_id, "name", term.name)
+            for synonym in term.synonyms:
+                self._add("term", term.go_id, "synonym", synonym)
+
+    def remove_terms(self, go_ids) -> None:
+        # after an ontology release: old labels stop matching, re-add changed terms with add_terms()
+        for go_id in go_ids:
+            for entry in self.__item_entries.pop(("term", go_id), []):
+                kind, item_id, _, label = self.__entries[entry]
+                self.__dead.add(entry)
+                self.__seen.discard((kind, item_id, label))
+            self.__names.pop(("term", go_id), None)
+
+    def add_genes(self, gene_names) -> None:
+        # also used after a GAF delta to make newly annotated genes searchable
+        for gene in gene_names:
+            if gene:
+                self.__names[("gene", gene)] = gene
+                self._add("gene", gene, "symbol", gene)
+
+    def _sort(self) -> None:
+        for name, keys in self.__keys.items():
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            self.__keys[name] = [keys[i] for i in order]
+            self.__key_entries[name] = [self.__key_entries[name][i] for i in order]
+        entries = self.__entries
+        order = sorted(range(len(entries)), key=lambda e: (self.field_rank[entries[e][2]], len(entries[e][3]),
+                                                            entries[e][1]))
+        self.__entry_rank = [0] * len(entries)
+        self.__field_starts = []
+        for position, entry in enumerate(order):
+            self.__entry_rank[entry] = position
+            if position and self.field_rank[entries[entry][2]] != self.field_rank[entries[order[position - 1]][2]]:
+                self.__field_starts.append(position)
+        self.__sorted = True
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def prefix(self, query: str, limit: int = 10, kind: str | None = None) -> list[dict]:
+        if not self.__sorted:
+            self._sort()
+        key = self.normalise(query)
+        if not key:
+            return []
+
+        hits: dict[tuple[str, str], dict] = {}
+        # whole labels first (exact 1.0, then label prefixes 0.9), word starts (0.8) only fill
+        # up the rest; each range is scanned in a bounded window and ranked afterwards
+        for position in ("label", "word"):
+            for item_kind in self.kinds if kind is None else (kind,):
+                keys, entries = self.__keys[(item_kind, position)], self.__key_entries[(item_kind, position)]
+                i = bisect_left(keys, key)
+                scanned = 0
+                while i < len(keys) and keys[i].startswith(key) and scanned < limit * 5:
+                    entry = entries[i]
+                    i += 1
+                    if entry in self.__dead:
+                        continue
+                    scanned += 1
+                    if position == "word":
+                        score = 0.8
+                    else:
+                        score = 1.0 if keys[i - 1] == key else 0.9
+                    self._keep(hits, entry, score)
+            if len(hits) >= limit:
+                break
+        return self._ranked(hits, limit)
+
+    def similar_words(self, word: str, min_score: float | None = None) -> dict[int, float]:
+        # vocabulary words within min_score Dice of `word`. A match shares at least `needed`
+        # trigrams, so it must contain one of the len(grams) - needed + 1 rarest ones and only
+        # those postings are read
+        if min_score is None:
+            min_score = self.__min_score
+        grams = self.trigrams(word)
+        needed = max(math.ceil(min_score * len(grams) / 2), 1)
+        rarest = sorted(grams, key=lambda g: len(self.__grams.get(g, ())))[:len(grams) - needed + 1]
+        candidates = {word_id for gram in rarest for word_id in self.__grams.get(gram, ())}
+
+        similar = {}
+        for word_id in candidates:
+            other = self.trigrams(self.__word_list[word_id])
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= min_score:
+                similar[word_id] = score
+        return similar
+
+    def fuzzy(self, query: str, limit: int = 10, kind: str | None = None) -> list[dict]:
+        words = [w for w in self.normalise(query).split(" ") if w]
+        words = [w for w in words if w not in self.stop_words] or words
+        if not words:
+            return []
+        # a word with no match at all is retried at the looser threshold (short words with a
+        # typo in the middle share few trigrams)
+        matches = [self.similar_words(w) or self.similar_words(w, self.__fallback_score) for w in words]
+        if not all(matches):
+            return []
+
+        # per query word: the best similarity each entry reaches with one of its words, filled
+        # from the postings (higher scores written last). Only entries found for every query
+        # word are scored, the smallest of these maps first
+        bests = []
+        for similar in matches:
+            best = {}
+            for word_id in sorted(similar, key=similar.__getitem__):
+                best.update(dict.fromkeys(self.__word_entries[word_id], similar[word_id]))
+            bests.append(best)
+        ordered = sorted(bests, key=len)
+        candidates = set(ordered[0])
+        for best in ordered[1:]:
+            candidates = best.keys() & candidates
+            if not candidates:
+                return []
+
+        if not self.__sorted:
+            self._sort()
+        candidates = list(candidates)
+        total = sum(np.fromiter(map(best.__getitem__, candidates), dtype=float, count=len(candidates))
+                    for best in bests)
+        # scaled so a fuzzy hit never outranks a prefix hit
+        scores = np.round(0.75 * total / len(words), 3)
+        ranks = np.fromiter(map(self.__entry_rank.__getitem__, candidates), dtype=np.int64, count=len(candidates))
+
+        # best score first, then an item's preferred label (field, then shortest) first, which is
+        # the label _keep() would pick. Within one score and field only the first `limit` new
+        # items can still make the list: the rest of that block is passed over in one go, and
+        # its items can't come back through a worse label later
+        order = np.lexsort((ranks, -scores))
+        scores, ranks = scores[order], ranks[order]
+        fields = np.searchsorted(self.__field_starts, ranks, side="right")
+        starts = np.flatnonzero(np.r_[True, (scores[1:] != scores[:-1]) | (fields[1:] != fields[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+        entries = np.array(candidates)[order].tolist()
+
+        hits: dict[tuple[str, str], dict] = {}
+        passed: set[int] = set()
+        last = math.inf
+        for start, end, score in zip(starts.tolist(), ends.tolist(), scores[starts].tolist()):
+            if len(hits) >= limit and score < last:
+                break
+            last = score
+            new = 0
+            for i in range(start, end):
+                entry = entries[i]
+                item_kind, item_id = self.__entries[entry][:2]
+                item = (item_kind, item_id)
+                if ((kind is not None and item_kind != kind) or entry in self.__dead or item in hits
+                        or any(e in passed for e in self.__item_entries.get(item, ()))):
+                    continue
+                if new == limit:
+                    passed.update(entries[i:end])
+                    break
+                self._keep(hits, entry, score)
+                new += 1
+        return self._ranked(hits, limit)
+
+    def search(self, query: str, limit: int = 10, kind: str | None = None) -> list[dict]:
+        # prefix hits first; fuzzy matches fill the rest of the list
+        if kind is not None and kind not in self.kinds:
+            raise ValueError(f"kind must be one of {self.kinds}")
+        hits = {(h["kind"], h["id"]): h for h in self.prefix(query, limit, kind)}
+        if len(hits) < limit:
+            for h in self.fuzzy(query, limit, kind):
+                hits.setdefault((h["kind"], h["id"]), h)
+        return self._ranked(hits, limit)
+
+    def _keep(self, hits: dict, entry: int, score: float) -> None:
+        # one hit per term/gene, keeping its best-scoring label
+        if entry in self.__dead:
+            return
+        kind, item_id, field, label = self.__entries[entry]
+        best = hits.get((kind, item_id))
+        if best is None or (score, -self.field_rank[field]) > (best["score"], -self.field_rank[best["field"]]):
+            hits[(kind, item_id)] = {"kind": kind, "id": item_id, "name": self.__names[(kind, item_id)],
+                                     "field": field, "match": label, "score": score}
+
+    @staticmethod
+    def _ranked(hits: dict, limit: int) -> list[dict]:
+        return sorted(hits.values(), key=lambda h: (-h["score"], len(h["match"]), h["id"]))[:limit]
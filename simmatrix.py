@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+
+class BlockedSimilarityMatrix:
+    # gene x gene jaccard matrix on disk. Only the upper triangle is kept, as square
+    # blocks (bi <= bj) in one memory-mapped file, so a row lookup reads one block row
+    # plus one block column and never the whole matrix. Values are float16 or uint8
+    # (similarity * 255). The directory can be shared by every worker and reused across restarts;
+    # meta.json records a fingerprint of the annotations it was built from.
+    dtypes = ("float16", "uint8")
+
+    def __init__(self, directory: str) -> None:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "genes.json")) as f:
+            self.__genes: list[str] = json.load(f)
+
+        self.__pos = {g: i for i, g in enumerate(self.__genes)}
+        self.__block = meta["block"]
+        self.__dtype = meta["dtype"]
+        self.fingerprint: str | None = meta.get("fingerprint")   # None for matrices built before it existed
+        self.__n_blocks = (len(self.__genes) + self.__block - 1) // self.__block
+        self.__data = np.memmap(os.path.join(directory, "similarity.dat"), dtype=self.__dtype, mode="r",
+                                shape=(max(self._n_pairs(self.__n_blocks), 1), self.__block, self.__block))
+
+    @staticmethod
+    def _n_pairs(n_blocks: int) -> int:
+        return n_blocks * (n_blocks + 1) // 2
+
+    @staticmethod
+    def _pair(bi: int, bj: int, n_blocks: int) -> int:
+        # position of block (bi, bj), bi <= bj, in row-major upper-triangle order
+        return bi * n_blocks - bi * (bi - 1) // 2 + (bj - bi)
+
+    @staticmethod
+    def annotation_fingerprint(gene2terms: dict[str, set[str]]) -> str:
+        # hash of the gene -> term sets, independent of row order in the GAF
+        digest = hashlib.blake2b(digest_size=16)
+        for gene in sorted(gene2terms):
+            digest.update(f"{gene}\t{','.join(sorted(gene2terms[gene]))}\n".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, gene2terms: dict[str, set[str]], directory: str,
+              block: int = 512, dtype: str = "uint8") -> "BlockedSimilarityMatrix":
+        if dtype not in cls.dtypes:
+            raise ValueError(f"dtype must be one of {cls.dtypes}")
+        # everything is written to a staging directory next to the target and renamed into
+        # place at the end, so readers never see genes/meta of one build with the data of another
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".simmatrix-", dir=parent)
+        try:
+            cls._write(gene2terms, staging, block, dtype)
+            os.chmod(staging, 0o755)
+            cls._swap(staging, directory)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return cls(directory)
+
+    @staticmethod
+    def _swap(staging: str, directory: str) -> None:
+        if not os.path.exists(directory):
+            os.rename(staging, directory)
+            return
+        old = staging + ".old"
+        os.rename(directory, old)
+        os.rename(staging, directory)
+        shutil.rmtree(old)   # memory-mapped readers of the old files keep them until they close
+
+    @classmethod
+    def _write(cls, gene2terms: dict[str, set[str]], directory: str, block: int, dtype: str) -> None:
+        genes = sorted(gene2terms)
+        term_pos: dict[str, int] = {}
+        # gene -> term ids as CSR, so every block is assembled with numpy
+        indptr = np.zeros(len(genes) + 1, dtype=np.int64)
+        indices = []
+        for i, gene in enumerate(genes):
+            ids = [term_pos.setdefault(t, len(term_pos)) for t in gene2terms[gene]]
+            indices.extend(ids)
+            indptr[i + 1] = indptr[i] + len(ids)
+        indices = np.array(indices, dtype=np.int64)
+        sizes = np.diff(indptr)
+
+        n_blocks = (len(genes) + block - 1) // block
+        path = os.path.join(directory, "similarity.dat")
+        out = np.memmap(path, dtype=dtype, mode="w+", shape=(max(cls._n_pairs(n_blocks), 1), block, block))
+
+        def dense(lo: int, hi: int, col_of: np.ndarray, n_cols: int) -> np.ndarray:
+            rows = np.repeat(np.arange(hi - lo), sizes[lo:hi])
+            cols = col_of[indices[indptr[lo]:indptr[hi]]]
+            keep = cols >= 0
+            X = np.zeros((hi - lo, n_cols), dtype=np.float32)
+            X[rows[keep], cols[keep]] = 1
+            return X
+
+        for bi in range(n_blocks):
+            lo_i, hi_i = bi * block, min((bi + 1) * block, len(genes))
+            # columns restricted to the terms used by this block's genes
+            used = np.unique(indices[indptr[lo_i]:indptr[hi_i]])
+            col_of = np.full(len(term_pos), -1, dtype=np.int64)
+            col_of[used] = np.arange(len(used))
+            Xi = dense(lo_i, hi_i, col_of, len(used))
+
+            for bj in range(bi, n_blocks):
+                lo_j, hi_j = bj * block, min((bj + 1) * block, len(genes))
+                inter = Xi @ dense(lo_j, hi_j, col_of, len(used)).T
+                union = sizes[lo_i:hi_i, None] + sizes[None, lo_j:hi_j] - inter
+                sim = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+                target = out[cls._pair(bi, bj, n_blocks)]
+                if dtype == "uint8":
+                    target[:hi_i - lo_i, :hi_j - lo_j] = np.rint(sim * 255)
+                else:
+                    target[:hi_i - lo_i, :hi_j - lo_j] = sim
+        out.flush()
+        del out
+
+        with open(os.path.join(directory, "genes.json"), "w") as f:
+            json.dump(genes, f)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"block": block, "dtype": dtype, "n_genes": len(genes),
+                       "fingerprint": cls.annotation_fingerprint(gene2terms)}, f)
+
+    @property
+    def genes(self) -> list[str]:
+        return self.__genes
+
+    def __len__(self) -> int:
+        return len(self.__genes)
+
+    def __contains__(self, gene: str) -> bool:
+        return gene in self.__pos
+
+    def _decode(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float32)
+        return values / 255 if self.__dtype == "uint8" else values
+
+    def get(self, gene1: str, gene2: str) -> float:
+        i = self.__pos.get(gene1)
+        j = self.__pos.get(gene2)
+        if i is None or j is None:
+            return 0.0
+        if i > j:
+            i, j = j, i
+        bi, bj = i // self.__block, j // self.__block
+        value = self.__data[self._pair(bi, bj, self.__n_blocks), i % self.__block, j % self.__block]
+        return float(self._decode(value))
+
+    def row(self, gene: str) -> np.ndarray | None:
+        i = self.__pos.get(gene)
+        if i is None:
+            return None
+        bi, li = divmod(i, self.__block)
+        parts = []
+        for bj in range(self.__n_blocks):
+            if bi <= bj:
+                parts.append(self.__data[self._pair(bi, bj, self.__n_blocks), li, :])
+            else:
+                parts.append(self.__data[self._pair(bj, bi, self.__n_blocks), :, li])
+        return self._decode(np.concatenate(parts)[:len(self.__genes)])
+
+    def neighbours(self, gene: str, k: int = 10) -> list[tuple[str, float]]:
+        row = self.row(gene)
+        if row is None or k < 1:
+            return []
+        row[self.__pos[gene]] = -1
+        k = min(k, len(row) - 1)
+        if k < 1:
+            return []
+        # every gene tied with the k-th score is a candidate; genes are stored sorted,
+        # so ordering by position breaks ties by name
+        kth = -np.partition(-row, k - 1)[k - 1]
+        candidates = np.flatnonzero(row >= kth)
+        top = candidates[np.lexsort((candidates, -row[candidates]))][:k]
+        return [(self.__genes[j], round(float(row[j]), 3)) for j in top if row[j] > 0]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute the gene similarity matrix for SIMILARITY_MATRIX.")
+    parser.add_argument("directory")
+    parser.add_argument("--obo", default="gene ontology.txt")
+    parser.add_argument("--gaf", default="gaf.txt")
+    parser.add_argument("--block", type=int, default=512)
+    parser.add_argument("--dtype", default="uint8", choices=BlockedSimilarityMatrix.dtypes)
+    args = parser.parse_args(argv)
+
+    from loader import load_data   # loader -> analysis imports this module, so not at the top
+
+    data = load_data(args.obo, args.gaf)
+    matrix = data["similarity_analyser"].save_matrix(args.directory, args.block, args.dtype)
+    print(f"{len(matrix)} genes written to {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# a GAF delta applied in place (AnnotationUpdater) must leave the same analysers as loading
+# the post-delta GAF from scratch
+import contextlib
+import io
+import random
+
+import pytest
+
+from loader import load_data
+from test_release_update import random_release, write_obo
+from updates import AnnotationUpdater
+
+EVIDENCE = ["IDA", "IMP", "IEA", "TAS", "ND"]
+
+
+def gaf_line(rng, gene: int, n_terms: int) -> str:
+    qualifier = rng.choice(["enables", "involved_in", "NOT|enables"])
+    return (f"UniProtKB\tP{gene:05d}\tGENE{gene}\t{qualifier}\tGO:{rng.randrange(n_terms):07d}\tPMID:{rng.randrange(9)}"
+            f"\t{rng.choice(EVIDENCE)}\t\tP\tname\t\tprotein\ttaxon:9606\n")
+
+
+def load(obo, gaf) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_data(str(obo), str(gaf))
+
+
+def summary(data: dict) -> dict:
+    return {k: v.to_dict() if hasattr(v, "to_dict") else v for k, v in data["summary"].items()}
+
+
+def matrix(data: dict):
+    sim = data["similarity_analyser"].compute
+    return sim.sort_index().sort_index(axis=1)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_delta_matches_reload(tmp_path, seed):
+    rng = random.Random(seed)
+    n_terms = rng.randint(20, 60)
+    write_obo(tmp_path / "go.obo", random_release(rng, n_terms))
+    lines = [gaf_line(rng, rng.randrange(40), n_terms) for _ in range(rng.randint(80, 200))]
+    with open(tmp_path / "old.gaf", "w") as f:
+        f.write("!gaf-version: 2.2\n" + "".join(lines))
+
+    data = load(tmp_path / "go.obo", tmp_path / "old.gaf")
+    # warm every lazy structure so the delta has to patch it
+    analyser = data["similarity_analyser"]
+    analyser.compute
+    for method in analyser.methods:
+        analyser.neighbours("GENE0", 3, method)
+    data["gene_analyser"].related_genes("GENE0")
+
+    # some genes lose every annotation, some lines go, new and existing genes gain lines
+    gone = set(rng.sample(range(40), 3))
+    removed = [line for line in lines if int(line.split("\t")[1][1:]) in gone]
+    removed += rng.sample([line for line in lines if line not in removed], 10)
+    added = [gaf_line(rng, rng.choice([rng.randrange(40, 45), rng.randrange(40)]), n_terms) for _ in range(15)]
+    added = [line for line in added if int(line.split("\t")[1][1:]) not in gone]
+    with open(tmp_path / "delta.txt", "w") as f:
+        f.write("".join("-" + line for line in removed) + "".join("+" + line for line in added))
+
+    report = AnnotationUpdater(data).apply_file(str(tmp_path / "delta.txt"))
+    assert report["not_found"] == 0
+
+    kept = list(lines)
+    for line in removed:
+        kept.remove(line)
+    with open(tmp_path / "new.gaf", "w") as f:
+        f.write("!gaf-version: 2.2\n" + "".join(kept + added))
+    fresh = load(tmp_path / "go.obo", tmp_path / "new.gaf")
+
+    genes = {f"GENE{i}" for i in range(45)}
+    for gene in sorted(genes):
+        assert data["gene_analyser"].related_genes(gene) == fresh["gene_analyser"].related_genes(gene)
+        for method in analyser.methods:
+            assert analyser.neighbours(gene, 5, method) == fresh["similarity_analyser"].neighbours(gene, 5, method)
+    assert summary(data) == summary(fresh)
+
+    sim, expected = matrix(data), matrix(fresh)
+    assert list(sim.index) == list(expected.index)
+    assert not {f"GENE{i}" for i in gone} & set(sim.index)
+    assert sim.values == pytest.approx(expected.values)
@@ -0,0 +1,231 @@
+# incremental ontology updates (ReleaseDiff.apply / OntologyUpdater) must leave the same
+# collection and hierarchy as loading the new release from scratch
+import contextlib
+import io
+import itertools
+import random
+
+import pytest
+
+from hierarchy import OntologyHierarchy
+from loader import load_data
+from ontology import Term, TermCollection
+from parsers import OBOParser
+from releasediff import ReleaseDiff
+from updates import OntologyUpdater
+
+RELS = ["part_of", "regulates", "positively_regulates"]
+
+
+def write_obo(path, terms: dict) -> None:
+    with open(path, "w") as f:
+        f.write("format-version: 1.2\n\n")
+        for t in terms.values():
+            f.write(f"[Term]\nid: {t['id']}\nname: {t['name']}\nnamespace: biological_process\n")
+            if t.get("def"):
+                f.write(f'def: "{t["def"]}" [X:1]\n')
+            for s in t.get("syn", []):
+                f.write(f'synonym: "{s}" EXACT []\n')
+            if t.get("obsolete"):
+                f.write("is_obsolete: true\n")
+                for r in t.get("replaced_by", []):
+                    f.write(f"replaced_by: {r}\n")
+            for p in t["is_a"]:
+                f.write(f"is_a: {p}\n")
+            for r, p in t["rels"]:
+                f.write(f"relationship: {r} {p}\n")
+            f.write("\n")
+        f.write("[Typedef]\nid: part_of\nname: part of\n")
+
+
+def build(path):
+    terms = TermCollection()
+    for row in OBOParser(str(path)).parse().to_dict("records"):
+        terms.add_term(Term(row["go_id"], row["name"], row["namespace"], row["parents"], row["definition"],
+                            row["synonyms"], row["relationships"]))
+    terms.build_vertical_relationship()
+    hierarchy = OntologyHierarchy(terms)
+    hierarchy.build_tree()
+    hierarchy.build_closure()
+    return terms, hierarchy
+
+
+def random_release(rng, n: int) -> dict:
+    terms = {}
+    for i in range(n):
+        go_id = f"GO:{i:07d}"
+        parents = rng.sample(range(i), min(i, rng.randint(1, 3))) if i else []
+        terms[go_id] = {"id": go_id, "name": f"term {i}", "syn": [f"syn {i}"],
+                        "is_a": [f"GO:{p:07d}" for p in parents[:2]],
+                        "rels": [(rng.choice(RELS), f"GO:{p:07d}") for p in parents[2:]]}
+    return terms
+
+
+def _descendants(terms: dict, go_id: str, live: list[str]) -> set[str]:
+    found, stack = {go_id}, [go_id]
+    while stack:
+        x = stack.pop()
+        for c in live:
+            if c not in found and (x in terms[c]["is_a"] or any(p == x for _, p in terms[c]["rels"])):
+                found.add(c)
+                stack.append(c)
+    return found
+
+
+def mutate(rng, terms: dict, new_ids) -> dict:
+    # random acyclic edits: added terms (also spliced between a parent and its child, which
+    # breaks the old position order), obsoleted / removed terms, renames, definitions, re-parenting
+    new = {k: dict(v, is_a=list(v["is_a"]), rels=list(v["rels"])) for k, v in terms.items()}
+    for _ in range(rng.randint(1, 15)):
+        live = [k for k, v in new.items() if not v.get("obsolete")]
+        op = rng.choice(["add", "add_mid", "obsolete", "remove", "rename", "reparent", "def"])
+        if op in ("add", "add_mid"):
+            go_id = next(new_ids)
+            parent = rng.choice(live)
+            new[go_id] = {"id": go_id, "name": f"new {go_id}", "is_a": [parent], "rels": [], "syn": []}
+            children = [k for k in live if parent in new[k]["is_a"]]
+            if op == "add_mid" and children:
+                child = new[rng.choice(children)]
+                child["is_a"] = [go_id if p == parent else p for p in child["is_a"]]
+        elif op in ("obsolete", "remove"):
+            victim = rng.choice(live)
+            for k in live:
+                t = new[k]
+                if victim in t["is_a"] or any(p == victim for _, p in t["rels"]):
+                    t["is_a"] = [p for p in t["is_a"] if p != victim] or new[victim]["is_a"][:1]
+                    t["rels"] = [(r, p) for r, p in t["rels"] if p != victim]
+            if op == "obsolete":
+                new[victim] = {"id": victim, "name": new[victim]["name"], "is_a": [], "rels": [],
+                               "obsolete": True, "replaced_by": new[victim]["is_a"][:1]}
+            else:
+                del new[victim]
+        elif op == "rename":
+            new[rng.choice(live)]["name"] += " renamed"
+        elif op == "def":
+            new[rng.choice(live)]["def"] = "changed"
+        else:
+            go_id = rng.choice(live)
+            candidates = [g for g in live if g not in _descendants(new, go_id, live)]
+            if candidates:
+                new[go_id]["is_a"] = rng.sample(candidates, min(len(candidates), rng.randint(1, 2)))
+                if rng.random() < 0.5:
+                    new[go_id]["rels"] = [(rng.choice(RELS), rng.choice(candidates))]
+    return new
+
+
+def state(terms: TermCollection, hierarchy: OntologyHierarchy) -> dict:
+    every = list(hierarchy.relations)
+    return {go_id: (t.name,
+                    frozenset(p.go_id for p in t.parents), frozenset(c.go_id for c in t.children),
+                    hierarchy.term_depth(go_id),
+                    frozenset(hierarchy.get_ancestors(go_id)), frozenset(hierarchy.get_descendants(go_id)),
+                    frozenset(hierarchy.get_ancestors(go_id, ["is_a"])),
+                    frozenset(hierarchy.get_descendants(go_id, ["is_a", "regulates"])),
+                    frozenset(hierarchy.get_ancestors(go_id, every)),
+                    frozenset(hierarchy.parent_ids(go_id, every)), frozenset(hierarchy.child_ids(go_id, every)))
+            for go_id, t in terms.terms.items()}
+
+
+def edges(subgraph: dict) -> tuple:
+    return {n["id"] for n in subgraph["nodes"]}, sorted(map(tuple, subgraph["edges"]))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_incremental_update_matches_rebuild(tmp_path, seed):
+    rng = random.Random(seed)
+    new_ids = (f"GO:{9000000 + i:07d}" for i in itertools.count())
+    old = random_release(rng, rng.randint(30, 300))
+    new = mutate(rng, old, new_ids)
+    if seed % 3 == 0:
+        new = mutate(rng, new, new_ids)
+    write_obo(tmp_path / "old.obo", old)
+    write_obo(tmp_path / "new.obo", new)
+
+    terms, hierarchy = build(tmp_path / "old.obo")
+    # warm the per-term caches so their invalidation is exercised too
+    ids = list(terms.terms)
+    for go_id in ids[::3]:
+        hierarchy.get_ancestors(go_id, ["is_a"])
+        hierarchy.get_descendants(go_id)
+        hierarchy.get_descendants(go_id, list(hierarchy.relations))
+    hierarchy.subgraph(ids[:3])
+
+    diff = ReleaseDiff(str(tmp_path / "old.obo"), str(tmp_path / "new.obo"))
+    closure_changed, _ = diff.apply(terms, hierarchy)
+    fresh_terms, fresh = build(tmp_path / "new.obo")
+    assert state(terms, hierarchy) == state(fresh_terms, fresh)
+
+    live = list(fresh_terms.terms)
+    for go_id in live[:5]:
+        for relations in (None, list(fresh.relations)):
+            assert edges(hierarchy.subgraph([go_id], relations, True, True)) == \
+                   edges(fresh.subgraph([go_id], relations, True, True))
+
+    # MSCA ties are broken by position, which differs after an update: compare how deep the picks are
+    for a, b in [(rng.choice(live), rng.choice(live)) for _ in range(40)]:
+        m1, m2 = hierarchy.MSCA(a, b), fresh.MSCA(a, b)
+        assert (m1 is None) == (m2 is None)
+        if m1 is not None:
+            assert len(hierarchy.longest_path(m1, a)) == len(fresh.longest_path(m2, a))
+
+    # every term whose ancestors moved is reported
+    _, before = build(tmp_path / "old.obo")
+    every = list(fresh.relations)
+    for go_id in live:
+        if go_id in old and set(before.get_ancestors(go_id, every)) != set(fresh.get_ancestors(go_id, every)):
+            assert go_id in closure_changed
+
+    assert set(diff.added) == {g for g in new if not new[g].get("obsolete")
+                               and (g not in old or old[g].get("obsolete"))}
+    assert set(diff.removed) == {g for g in set(old) - set(new) if not old[g].get("obsolete")}
+    assert set(diff.obsoleted) == {g for g in set(old) & set(new)
+                                   if new[g].get("obsolete") and not old[g].get("obsolete")}
+
+
+def test_cycle_is_rejected_before_anything_changes(tmp_path):
+    old = random_release(random.Random(7), 40)
+    write_obo(tmp_path / "old.obo", old)
+    terms, hierarchy = build(tmp_path / "old.obo")
+    before = state(terms, hierarchy)
+
+    # GO:0000001 under one of its own descendants
+    child = next(g for g, t in old.items() if "GO:0000001" in t["is_a"])
+    new = {k: dict(v) for k, v in old.items()}
+    new["GO:0000001"] = dict(new["GO:0000001"], is_a=[child], name="now cyclic")
+    write_obo(tmp_path / "new.obo", new)
+
+    diff = ReleaseDiff(str(tmp_path / "old.obo"), str(tmp_path / "new.obo"))
+    with pytest.raises(ValueError, match="cycle"):
+        diff.apply(terms, hierarchy)
+    assert state(terms, hierarchy) == before
+
+
+def test_updater_diffs_against_the_loaded_release(tmp_path):
+    rng = random.Random(3)
+    old = random_release(rng, 30)
+    new = mutate(rng, old, (f"GO:{9000000 + i:07d}" for i in itertools.count()))
+    obo = tmp_path / "go.obo"
+    gaf = tmp_path / "gaf.txt"
+    write_obo(obo, old)
+    with open(gaf, "w") as f:
+        f.write("!gaf-version: 2.2\n")
+        for i in range(20):
+            f.write(f"UniProtKB\tP{i:05d}\tGENE{i}\tinvolved_in\tGO:{rng.randrange(30):07d}\tPMID:1\tIDA\t\tP"
+                    f"\tname\t\tprotein\ttaxon:9606\n")
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = load_data(str(obo), str(gaf))
+
+    # the index built from the parsed rows matches a fresh index of the file's live terms
+    assert data["release_index"] == ReleaseDiff.build_index(str(obo))
+
+    # the loaded file changing on disk does not move the diff base
+    write_obo(obo, new)
+    write_obo(tmp_path / "new.obo", new)
+    updater = OntologyUpdater(data)
+    diff = updater.diff(str(tmp_path / "new.obo"))
+    write_obo(tmp_path / "old.obo", old)
+    assert diff.to_dict() == ReleaseDiff(str(tmp_path / "old.obo"), str(tmp_path / "new.obo")).to_dict()
+
+    updater.apply(diff)
+    again = updater.diff(str(tmp_path / "new.obo"))
+    assert again.to_dict()["counts"] == dict.fromkeys(again.to_dict()["counts"], 0)
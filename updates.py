@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from parsers import GAFParser, GAFDeltaParser
+from annotations import GeneAnnotation
+from filters import AnnotationFilter, POSITIVE
+from releasediff import ReleaseDiff
+
+
+class AnnotationUpdater:
+    # applies a GAF delta (added / removed lines) to the structures built by load_data()
+    # in place, touching only the rows and genes the delta mentions
+
+    def __init__(self, data: dict, analysis_filter: AnnotationFilter = POSITIVE) -> None:
+        self.__data = data
+        self.__filter = analysis_filter
+
+    def apply_file(self, delta_path: str) -> dict:
+        added_df, removed_df = GAFDeltaParser(delta_path).parse()
+        return self.apply(added_df, removed_df)
+
+    def _match_removed(self, removed_df: pd.DataFrame) -> tuple[list[int], int]:
+        # a removed line deletes one identical annotation of the same gene
+        annotations = self.__data["annotations"]
+        rows = annotations.annotations
+        taken = set()
+        matched = []
+        missing = 0
+
+        for line in removed_df.to_dict("records"):
+            for i in annotations.rows_by("gene_id", line["gene_id"]):
+                if i not in taken and all(getattr(rows[i], col) == line[col] for col in GAFParser.columns):
+                    taken.add(i)
+                    matched.append(i)
+                    break
+            else:
+                missing += 1
+        return matched, missing
+
+    def apply(self, added_df: pd.DataFrame, removed_df: pd.DataFrame) -> dict:
+        data = self.__data
+        old_df = data["annotation_df"]
+
+        removed_rows, missing = self._match_removed(removed_df)
+        keep = np.ones(len(old_df), dtype=bool)
+        keep[removed_rows] = False
+        removed_df = old_df[~keep]
+
+        # DataFrame and collection both drop the removed rows and append the new ones,
+        # which keeps row ids aligned for the masks
+        new_df = pd.concat([old_df[keep], added_df[GAFParser.columns]], ignore_index=True)
+        new_annotations = []
+        for row in added_df[GAFParser.columns].to_dict("records"):
+            ann = GeneAnnotation(**row)
+            ann.link_term(data["term_collection"])
+            new_annotations.append(ann)
+        data["annotations"].apply_delta(removed_rows, new_annotations)
+
+        masks = data["masks"]
+        masks.apply_delta(keep, added_df)
+        mask = masks.select(self.__filter)
+
+        genes = set(added_df["gene_name"]) | set(removed_df["gene_name"])
+        data["gene_analyser"].refresh_genes(genes, mask)
+        data["similarity_analyser"].update_annotations(new_df, mask)
+        data["similarity_analyser"].refresh_genes(genes)
+        if "search_index" in data:
+            data["search_index"].add_genes(set(added_df["gene_name"]))
+
+        stats = data["summary_statistics"]
+        stats.update_annotations(new_df)
+        data["summary"] = stats.apply_delta(data["summary"], added_df, removed_df)
+        data["annotation_df"] = new_df
+
+        return {
+            "added": len(added_df),
+            "removed": len(removed_rows),
+            "not_found": missing,
+            "genes_touched": len(genes),
+            "total_annotations": len(new_df)
+        }
+
+
+class OntologyUpdater:
+    # applies a new GO release to the structures built by load_data() in place: only changed
+    # terms are swapped, the hierarchy closure is patched for their descendants and only genes
+    # annotated to affected terms are refreshed
+
+    def __init__(self, data: dict, analysis_filter: AnnotationFilter = POSITIVE) -> None:
+        self.__data = data
+        self.__filter = analysis_filter
+
+    def diff(self, obo_path: str) -> ReleaseDiff:
+        # against the index of the loaded release built by load_data(), never the file on disk
+        return ReleaseDiff(self.__data["release_index"], obo_path)
+
+    def apply_file(self, obo_path: str) -> dict:
+        return self.apply(self.diff(obo_path))
+
+    def apply(self, diff: ReleaseDiff) -> dict:
+        data = self.__data
+        terms = data["term_collection"]
+        annotations = data["annotations"]
+
+        closure_changed, descendants_changed = diff.apply(terms, data["hierarchy"])
+        data["release_index"] = diff.index
+
+        # annotations on swapped / dropped terms point at the new Term (or None)
+        swapped = set(diff.changed_ids) | set(diff.gone_ids)
+        for go_id in swapped:
+            for ann in annotations.get_by_term(go_id):
+                ann.link_term(terms)
+
+        affected = diff.affected_annotations(((ann.gene_name, ann.go_id) for ann in annotations), closure_changed)
+        genes = set()
+        for category in affected.values():
+            genes.update(category["genes"])
+        genes.update(ann.gene_name for go_id in diff.added for ann in annotations.get_by_term(go_id))
+        # genes on ancestors of changed terms only need their cached descendant closure dropped
+        above = {ann.gene_name for go_id in descendants_changed for ann in annotations.get_by_term(go_id)}
+
+        mask = data["masks"].select(self.__filter)
+        data["gene_analyser"].refresh_genes(genes | above, mask)
+        data["similarity_analyser"].refresh_semantic(genes)
+
+        if "search_index" in data:
+            data["search_index"].remove_terms(swapped)
+            data["search_index"].add_terms(terms.get_term(go_id) for go_id in diff.changed_ids)
+
+        old_df = data["ontology_df"]
+        ontology_df = pd.concat([old_df[~old_df["go_id"].isin(swapped)], pd.DataFrame(diff.rows(), columns=old_df.columns)],
+                                ignore_index=True)
+        data["ontology_df"] = ontology_df
+        data["similarity_analyser"].update_ontology(ontology_df)
+        stats = data["summary_statistics"]
+        stats.update_ontology(ontology_df)
+        data["summary"] = stats.compute
+
+        report = diff.to_dict()
+        report["annotations"] = {name: {"terms": c["terms"], "annotations": c["annotations"], "genes": len(c["genes"])}
+                                 for name, c in affected.items()}
+        report["closure_changed"] = len(closure_changed)
+        report["genes_touched"] = len(genes)
+        return report